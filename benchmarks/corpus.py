@@ -0,0 +1,94 @@
+"""Generates deterministic synthetic corpora resembling sets of firmware images."""
+
+from enum import Enum
+from pathlib import Path
+from typing import Annotated
+import numpy as np
+import typer
+
+# planted a few times in every file, so that searches have matches to report
+MARKER = b"REVENBENCH"
+HEADER_SIZE = 256
+DEFAULT_SIZE = 1 << 20
+
+
+class Kind(str, Enum):
+    RANDOM = "random"
+    LOW_ENTROPY = "low-entropy"
+    HEADER = "header"
+    NEAR_DUPLICATE = "near-duplicate"
+
+
+def _low_entropy(rng: np.random.Generator, size: int) -> bytes:
+    # mostly padding and a few printable bytes, as in sparse images and string tables
+    values = np.array([0x00, 0xFF, 0x20, 0x41, 0x65, 0x74], dtype=np.uint8)
+    weights = [0.6, 0.2, 0.05, 0.05, 0.05, 0.05]
+    return rng.choice(values, size, p=weights).tobytes()
+
+
+def generate_file(
+    kind: Kind, rng: np.random.Generator, size: int, base: bytes
+) -> bytes:
+    """Generates a file of kind. base is shared by all files of a corpus and is used as
+    the header, or as the file that near-duplicates are derived from."""
+    match kind:
+        case Kind.RANDOM:
+            data = bytearray(rng.bytes(size))
+        case Kind.LOW_ENTROPY:
+            data = bytearray(_low_entropy(rng, size))
+        case Kind.HEADER:
+            data = bytearray(base[:HEADER_SIZE] + rng.bytes(max(size - HEADER_SIZE, 0)))
+            # version and checksum fields differ between files
+            data[8:12] = rng.bytes(4)
+            data[HEADER_SIZE - 4 : HEADER_SIZE] = rng.bytes(4)
+        case Kind.NEAR_DUPLICATE:
+            data = bytearray(base[:size])
+            positions = rng.integers(0, size, max(size // 1000, 1))
+            data_view = np.frombuffer(data, dtype=np.uint8)
+            data_view[positions] = rng.integers(0, 256, len(positions), dtype=np.uint8)
+            del data_view
+
+    if size > HEADER_SIZE + len(MARKER):
+        for position in rng.integers(HEADER_SIZE, size - len(MARKER), 4):
+            data[position : position + len(MARKER)] = MARKER
+    return bytes(data[:size])
+
+
+def generate(
+    path: Path, kinds: list[Kind], count: int, size: int, seed: int = 0
+) -> dict[Kind, list[Path]]:
+    """Writes count files of size bytes of every kind to path/kind/ and returns their
+    paths. The same seed always generates the same files."""
+    files = {}
+    for kind in kinds:
+        # every kind has its own stream, so that it does not depend on the other kinds
+        rng = np.random.default_rng([seed, list(Kind).index(kind)])
+        base = rng.bytes(max(size, HEADER_SIZE))
+        directory = path / kind.value
+        directory.mkdir(parents=True, exist_ok=True)
+        files[kind] = []
+        for i in range(count):
+            file = directory / f"{i:05}.bin"
+            file.write_bytes(generate_file(kind, rng, size, base))
+            files[kind].append(file)
+    return files
+
+
+def main(
+    path: Annotated[Path, typer.Argument(help="The directory to write the corpus to.")],
+    kinds: Annotated[
+        list[Kind], typer.Option("--kind", "-k", help="The kinds of files to generate.")
+    ] = list(Kind),
+    count: Annotated[
+        int, typer.Option("--count", "-n", help="The number of files of every kind.")
+    ] = 100,
+    size: Annotated[
+        int, typer.Option("--size", "-s", help="The size of every file in bytes.")
+    ] = DEFAULT_SIZE,
+    seed: Annotated[int, typer.Option("--seed")] = 0,
+):
+    generate(path, kinds, count, size, seed)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,264 @@
+"""Times the native search and statistics kernels, the commands of the CLI and its
+startup on a synthetic corpus, and compares the results with a baseline.
+
+    python benchmarks/run.py -o results.json
+    python benchmarks/run.py --baseline results.json
+
+Kernels run in this process on files read into memory beforehand, while commands run
+in a new process each, so their times include startup and reading the files."""
+
+from collections.abc import Callable
+import functools
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Annotated, Optional
+import typer
+from corpus import MARKER, Kind, generate
+import reven.fast.ngram as fast_ngram
+import reven.fast.stats as fast_stats
+from reven.ops.pattern import Pattern, PatternSet, find_pattern
+from reven.ops.search import search_bytes
+
+PATTERN = Pattern("52 45 56 ?? 4e 42 45 4e")
+PATTERN_SET = PatternSet(
+    [PATTERN, "de ad be ef", "7f 45 4c 46", "00 00 ?? ff ff", "1? 2? 3? 4?"]
+)
+
+
+class Corpus:
+    def __init__(self, files: dict[Kind, list[Path]]):
+        self.files = files
+
+    @functools.cache
+    def data(self, kind: Kind) -> list[bytes]:
+        return [file.read_bytes() for file in self.files[kind]]
+
+    def all_data(self) -> list[bytes]:
+        return [data for kind in self.files for data in self.data(kind)]
+
+    def paths(self, kind: Optional[Kind] = None) -> list[str]:
+        kinds = [kind] if kind else list(self.files)
+        return [str(file) for kind in kinds for file in self.files[kind]]
+
+
+BENCHMARKS: dict[str, Callable[[Corpus], None]] = {}
+
+
+def benchmark(name: str):
+    def register(fn: Callable[[Corpus], None]):
+        BENCHMARKS[name] = fn
+        return fn
+
+    return register
+
+
+def _command(*args: str) -> Callable[[Corpus], None]:
+    """Registers a command of the CLI, where the arguments of files are replaced by the
+    paths of the files of a kind, or of every kind."""
+
+    def run(corpus: Corpus):
+        argv = []
+        for arg in args:
+            if arg == "*":
+                argv += corpus.paths()
+            elif arg.startswith("*"):
+                argv += corpus.paths(Kind(arg[1:]))
+            else:
+                argv.append(arg)
+        subprocess.run(
+            [sys.executable, "-m", "reven.main", "--no-cache", *argv],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            check=True,
+        )
+
+    return run
+
+
+@benchmark("kernel/search-text")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        search_bytes(MARKER, data)
+
+
+@benchmark("kernel/search-hex")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        search_bytes(b"\xde\xad\xbe\xef", data)
+
+
+@benchmark("kernel/search-pattern-byte")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        PATTERN.search(data, "byte")
+
+
+@benchmark("kernel/search-pattern-nibble")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        PATTERN.search(data, "nibble")
+
+
+@benchmark("kernel/search-pattern-set")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        PATTERN_SET.search(data)
+
+
+@benchmark("kernel/ngram-2")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        fast_ngram.count_ngrams(data, 2, 1)
+
+
+@benchmark("kernel/ngram-4")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        fast_ngram.count_ngrams(data, 4, 6)
+
+
+@benchmark("kernel/ngram-top-k")
+def _(corpus: Corpus):
+    summary = fast_ngram.Summary(4, 4096)
+    for data in corpus.all_data():
+        summary.update(data)
+
+
+@benchmark("kernel/byte-freq")
+def _(corpus: Corpus):
+    for data in corpus.all_data():
+        fast_stats.histogram(data)
+
+
+@benchmark("kernel/find-patterns")
+def _(corpus: Corpus):
+    find_pattern(data[:4096] for data in corpus.data(Kind.HEADER))
+
+
+BENCHMARKS.update(
+    {
+        "command/startup": _command("slice", "--help"),
+        "command/search-text": _command(
+            "search", "--data-format", "text", "REVENBENCH", "*"
+        ),
+        "command/search-hex": _command(
+            "search", "--data-format", "hex", "deadbeef", "*"
+        ),
+        "command/search-pattern": _command(
+            "search", "--data-format", "pattern", PATTERN.string, "*"
+        ),
+        "command/ngram": _command("ngram", "4", "*low-entropy"),
+        "command/byte-freq": _command("byte-freq", "*"),
+        "command/find-patterns": _command("find-patterns", "256", "*header"),
+        "command/slice": _command("slice", "0", "+256", "*"),
+    }
+)
+
+
+def time_benchmark(fn: Callable[[], None], repeats: int) -> dict:
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "times": times}
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list[str]:
+    """Prints the change of the median time of every benchmark and returns the names of
+    those which became slower by more than threshold."""
+    if results["meta"]["corpus"] != baseline["meta"]["corpus"]:
+        print("The baseline was measured on a different corpus.", file=sys.stderr)
+
+    regressions = []
+    for name, result in results["results"].items():
+        if name not in baseline["results"]:
+            continue
+        ratio = result["median"] / baseline["results"][name]["median"]
+        regressed = ratio > 1 + threshold
+        if regressed:
+            regressions.append(name)
+        print(
+            f"{name:32} {result['median']:10.4f}s {ratio:7.2f}x"
+            + (" REGRESSION" if regressed else ""),
+            file=sys.stderr,
+        )
+    return regressions
+
+
+def main(
+    corpus_dir: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--corpus",
+            help="The directory to generate the corpus in. Defaults to a temporary \
+directory.",
+        ),
+    ] = None,
+    count: Annotated[int, typer.Option("--count", "-n")] = 20,
+    size: Annotated[int, typer.Option("--size", "-s")] = 1 << 20,
+    seed: Annotated[int, typer.Option("--seed")] = 0,
+    repeats: Annotated[int, typer.Option("--repeats", "-r")] = 5,
+    select: Annotated[
+        Optional[str],
+        typer.Option("--select", "-k", help="Only run benchmarks containing this."),
+    ] = None,
+    output: Annotated[
+        Optional[Path], typer.Option("--output", "-o", help="Where to write results.")
+    ] = None,
+    baseline: Annotated[
+        Optional[Path],
+        typer.Option("--baseline", help="Results to compare with, e.g. of main."),
+    ] = None,
+    threshold: Annotated[
+        float,
+        typer.Option(
+            "--threshold", help="The relative slowdown reported as a regression."
+        ),
+    ] = 0.2,
+):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = corpus_dir or Path(tmp)
+        corpus = Corpus(generate(path, list(Kind), count, size, seed))
+
+        results = {
+            "meta": {
+                "python": platform.python_version(),
+                "machine": platform.machine(),
+                "corpus": {"count": count, "size": size, "seed": seed},
+                "repeats": repeats,
+            },
+            "results": {},
+        }
+        for name, fn in BENCHMARKS.items():
+            if select and select not in name:
+                continue
+            # the first run reads the corpus into memory or the page cache
+            fn(corpus)
+            results["results"][name] = time_benchmark(lambda: fn(corpus), repeats)
+            print(
+                f"{name:32} {results['results'][name]['median']:10.4f}s",
+                file=sys.stderr,
+            )
+
+    if output:
+        output.write_text(json.dumps(results, indent=2))
+    else:
+        print(json.dumps(results, indent=2))
+
+    if baseline:
+        regressions = compare(results, json.loads(baseline.read_text()), threshold)
+        if regressions:
+            print(f"{len(regressions)} benchmarks regressed.", file=sys.stderr)
+            raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -4,5 +4,6 @@ setup(
     ext_modules=[
         Extension("reven.fast.pattern", sources=["src/reven/fast/pattern.c"]),
         Extension("reven.fast.ngram", sources=["src/reven/fast/ngram.c"]),
+        Extension("reven.fast.stats", sources=["src/reven/fast/stats.c"]),
     ]
 )
@@ -1,3 +1,3 @@
-from reven.lib import Nibbles, Tabular, TabularColumn, is_tty
+from reven.lib import Nibbles, Tabular, TabularColumn, increment, is_tty, stage
 
-__all__ = ["Nibbles", "Tabular", "TabularColumn", "is_tty"]
+__all__ = ["Nibbles", "Tabular", "TabularColumn", "increment", "is_tty", "stage"]
@@ -0,0 +1,256 @@
+from __future__ import annotations
+import contextlib
+import os
+import time
+import unittest
+from pathlib import Path
+from typing import Any, Iterator, Optional
+
+# hashlib, pickle, sqlite3 and tempfile are imported where they are used, since every
+# command imports this module
+
+# bump when the results of an operation change so that old entries are not reused
+CACHE_VERSION = 1
+MAX_CACHE_SIZE = 1 << 30
+
+# set to False by --no-cache
+enabled = True
+
+
+def cache_dir() -> Path:
+    if "REVEN_CACHE_DIR" in os.environ:
+        return Path(os.environ["REVEN_CACHE_DIR"])
+    base = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+    return Path(base) / "reven"
+
+
+def file_digest(path: str) -> str:
+    import hashlib
+
+    with open(path, "rb") as file:
+        return hashlib.file_digest(
+            file, lambda: hashlib.blake2b(digest_size=20)
+        ).hexdigest()
+
+
+def data_digest(data: bytes) -> str:
+    """Returns the same digest as file_digest for the content of a file."""
+    import hashlib
+
+    return hashlib.blake2b(data, digest_size=20).hexdigest()
+
+
+class ResultCache:
+    """Stores the results of operations on files, keyed by the hash of their content
+    and a key describing the operation and its parameters. The hash of a file is
+    reused while its size and modification time are unchanged, and the least recently
+    used results are evicted once the cache grows beyond max_size bytes."""
+
+    def __init__(self, path: Path, max_size: int = MAX_CACHE_SIZE):
+        import sqlite3
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self.db = sqlite3.connect(path, timeout=30, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS files "
+            "(path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS results "
+            "(digest TEXT, operation TEXT, value BLOB, size INTEGER, accessed REAL, "
+            "PRIMARY KEY (digest, operation))"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+        )
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def operation_key(key: str) -> str:
+        import hashlib
+
+        return hashlib.blake2b(
+            f"{CACHE_VERSION}:{key}".encode(), digest_size=20
+        ).hexdigest()
+
+    def digest(self, path: str) -> str:
+        digest = self.known_digest(path)
+        if digest is None:
+            digest = file_digest(path)
+            self.set_digest(path, digest)
+        return digest
+
+    def known_digest(self, path: str) -> Optional[str]:
+        """Returns the digest of a file if it was stored and the file is unchanged,
+        without reading the file."""
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        row = self.db.execute(
+            "SELECT digest FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+            (path, stat.st_size, stat.st_mtime_ns),
+        ).fetchone()
+        return row[0] if row else None
+
+    def set_digest(self, path: str, digest: str):
+        path = os.path.realpath(path)
+        stat = os.stat(path)
+        self.db.execute(
+            "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+            (path, stat.st_size, stat.st_mtime_ns, digest),
+        )
+
+    def contains(self, digest: str, operation: str) -> bool:
+        row = self.db.execute(
+            "SELECT 1 FROM results WHERE digest = ? AND operation = ?",
+            (digest, operation),
+        ).fetchone()
+        return row is not None
+
+    def get(self, digest: str, operation: str) -> Any:
+        row = self.db.execute(
+            "SELECT value FROM results WHERE digest = ? AND operation = ?",
+            (digest, operation),
+        ).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        import pickle
+
+        self.db.execute(
+            "UPDATE results SET accessed = ? WHERE digest = ? AND operation = ?",
+            (time.time(), digest, operation),
+        )
+        return pickle.loads(row[0])
+
+    def put(self, digest: str, operation: str, value: Any):
+        import pickle
+
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        self.db.execute(
+            "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+            (digest, operation, blob, len(blob), time.time()),
+        )
+
+    def size(self) -> int:
+        (size,) = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        return size
+
+    def stats(self) -> dict[str, int]:
+        entries, size = self.db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+        (files,) = self.db.execute("SELECT COUNT(*) FROM files").fetchone()
+        return {"entries": entries, "size": size, "files": files}
+
+    def prune(self, max_size: Optional[int] = None) -> int:
+        """Evicts the least recently used results until at most max_size bytes remain
+        and forgets deleted files. Returns the number of evicted results."""
+        max_size = self.max_size if max_size is None else max_size
+        evicted = 0
+        excess = self.size() - max_size
+        if excess > 0:
+            rows = self.db.execute(
+                "SELECT digest, operation, size FROM results ORDER BY accessed"
+            ).fetchall()
+            with self.transaction():
+                for digest, operation, size in rows:
+                    if excess <= 0:
+                        break
+                    self.db.execute(
+                        "DELETE FROM results WHERE digest = ? AND operation = ?",
+                        (digest, operation),
+                    )
+                    excess -= size
+                    evicted += 1
+
+        with self.transaction():
+            for (path,) in self.db.execute("SELECT path FROM files").fetchall():
+                if not os.path.exists(path):
+                    self.db.execute("DELETE FROM files WHERE path = ?", (path,))
+        return evicted
+
+    @contextlib.contextmanager
+    def transaction(self) -> Iterator[None]:
+        self.db.execute("BEGIN")
+        try:
+            yield
+        except BaseException:
+            self.db.execute("ROLLBACK")
+            raise
+        self.db.execute("COMMIT")
+
+
+def open_cache() -> Optional[ResultCache]:
+    """Opens the default cache, or returns None if caching is disabled or unavailable."""
+    if not enabled:
+        return None
+    import sqlite3
+
+    try:
+        return ResultCache(cache_dir() / "results.sqlite")
+    except (OSError, sqlite3.Error):
+        return None
+
+
+class ResultCacheTests(unittest.TestCase):
+    def setUp(self):
+        import tempfile
+
+        self.dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(Path(self.dir.name) / "cache.sqlite", max_size=1000)
+        self.file = Path(self.dir.name) / "input.bin"
+        self.file.write_bytes(b"\xde\xad\xbe\xef")
+
+    def tearDown(self):
+        self.cache.close()
+        self.dir.cleanup()
+
+    def test_digest(self):
+        self.assertIsNone(self.cache.known_digest(str(self.file)))
+        digest = self.cache.digest(str(self.file))
+        self.assertEqual(digest, self.cache.known_digest(str(self.file)))
+        self.assertEqual(digest, data_digest(self.file.read_bytes()))
+        self.file.write_bytes(b"\xde\xad\xbe\xef\x00")
+        self.assertNotEqual(digest, self.cache.digest(str(self.file)))
+
+    def test_get_put(self):
+        operation = ResultCache.operation_key("test")
+        self.assertFalse(self.cache.contains("a", operation))
+        self.cache.put("a", operation, [1, 2, 3])
+        self.assertTrue(self.cache.contains("a", operation))
+        self.assertEqual([1, 2, 3], self.cache.get("a", operation))
+        with self.assertRaises(KeyError):
+            self.cache.get("b", operation)
+
+    def test_prune(self):
+        operation = ResultCache.operation_key("test")
+        for digest in ("a", "b", "c"):
+            self.cache.put(digest, operation, bytes(400))
+            time.sleep(0.01)
+        self.cache.get("a", operation)
+        self.assertEqual(1, self.cache.prune())
+        self.assertFalse(self.cache.contains("b", operation))
+        self.assertTrue(self.cache.contains("a", operation))
+
+    def test_duplicates_processed_once(self):
+        from reven import lib
+
+        copy = Path(self.dir.name) / "copy.bin"
+        copy.write_bytes(self.file.read_bytes())
+        names = [str(self.file), str(copy)]
+        calls = []
+
+        def fn(input):
+            calls.append(input)
+            with lib.map_input(input) as data:
+                return bytes(data)
+
+        results = lib._map_cached(fn, names, names, 1, self.cache, "test")
+        self.assertEqual([b"\xde\xad\xbe\xef"] * 2, list(results))
+        self.assertEqual(1, len(calls))
@@ -3,54 +3,924 @@
 #include <math.h>
 #include <object.h>
 #include <stdbool.h>
+#include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 
+/*
+ * N-grams are counted without touching any Python objects, so the GIL can be
+ * released while counting. Every counter remembers the first occurrence of its
+ * n-gram in the data, which is used to copy out the n-grams that reach the
+ * minimum count and to report them in order of appearance.
+ *
+ * N-grams of up to 2 bytes are counted in a directly indexed array. N-grams of
+ * up to 8 bytes are packed into an integer key which is rolled forward a byte
+ * at a time. Longer n-grams are hashed with a rolling polynomial hash and
+ * compared against their first occurrence on collisions.
+ */
+
+#define HASH_BASE 0x100000001B3ULL
+#define MAX_DIRECT_LEN 2
+#define MAX_PACKED_LEN 8
+
+typedef struct
+{
+    uint64_t key; // the packed n-gram, or its hash for longer n-grams
+    size_t offset;
+    size_t count; // 0 marks an empty slot
+} Entry;
+
+typedef struct
+{
+    Entry *entries;
+    size_t cap;
+    size_t len;
+} Table;
+
+typedef struct
+{
+    size_t offset;
+    size_t count;
+} Survivor;
+
+typedef struct
+{
+    Survivor *items;
+    size_t len;
+} Survivors;
+
+static PyObject *array_type = NULL;
+
+static inline uint64_t mix(uint64_t key)
+{
+    // mix the bits so that the low bits used for slots are well distributed
+    key ^= key >> 29;
+    key *= 0xBF58476D1CE4E5B9ULL;
+    key ^= key >> 32;
+    return key;
+}
+
+static bool table_grow(Table *table)
+{
+    size_t cap = table->cap ? table->cap * 2 : 1024;
+    Entry *entries = calloc(cap, sizeof(Entry));
+    if (!entries)
+    {
+        return false;
+    }
+    for (size_t i = 0; i < table->cap; i++)
+    {
+        Entry *e = &table->entries[i];
+        if (e->count == 0)
+        {
+            continue;
+        }
+        size_t slot = mix(e->key) & (cap - 1);
+        while (entries[slot].count != 0)
+        {
+            slot = (slot + 1) & (cap - 1);
+        }
+        entries[slot] = *e;
+    }
+    free(table->entries);
+    table->entries = entries;
+    table->cap = cap;
+    return true;
+}
+
+/* Finds the slot of a key, comparing the n-grams themselves when slices are given. */
+static inline Entry *table_find(Table *table, uint64_t key, const unsigned char *data,
+                                size_t offset, size_t length)
+{
+    size_t slot = mix(key) & (table->cap - 1);
+    while (true)
+    {
+        Entry *e = &table->entries[slot];
+        if (e->count == 0 ||
+            (e->key == key &&
+             (!data || memcmp(data + e->offset, data + offset, length) == 0)))
+        {
+            return e;
+        }
+        slot = (slot + 1) & (table->cap - 1);
+    }
+}
+
+static inline bool table_add(Table *table, uint64_t key, const unsigned char *data,
+                             size_t offset, size_t length)
+{
+    if ((table->len + 1) * 2 > table->cap && !table_grow(table))
+    {
+        return false;
+    }
+    Entry *e = table_find(table, key, data, offset, length);
+    if (e->count == 0)
+    {
+        e->key = key;
+        e->offset = offset;
+        table->len++;
+    }
+    e->count++;
+    return true;
+}
+
+static bool survivors_from_table(Survivors *survivors, const Table *table,
+                                 size_t min_count)
+{
+    survivors->items = malloc((table->len ? table->len : 1) * sizeof(Survivor));
+    if (!survivors->items)
+    {
+        return false;
+    }
+    for (size_t i = 0; i < table->cap; i++)
+    {
+        const Entry *e = &table->entries[i];
+        if (e->count != 0 && e->count >= min_count)
+        {
+            survivors->items[survivors->len++] = (Survivor){e->offset, e->count};
+        }
+    }
+    return true;
+}
+
+static bool count_direct(Survivors *survivors, const unsigned char *data, size_t data_len,
+                         size_t length, size_t min_count)
+{
+    size_t size = (size_t)1 << (8 * length);
+    size_t *counts = calloc(size, sizeof(size_t));
+    size_t *offsets = malloc(size * sizeof(size_t));
+    survivors->items = malloc(size * sizeof(Survivor));
+    if (!counts || !offsets || !survivors->items)
+    {
+        free(counts);
+        free(offsets);
+        return false;
+    }
+
+    uint32_t key = 0, key_mask = size - 1;
+    for (size_t i = 0; i < data_len; i++)
+    {
+        key = ((key << 8) | data[i]) & key_mask;
+        if (i + 1 < length)
+        {
+            continue;
+        }
+        if (counts[key]++ == 0)
+        {
+            offsets[key] = i + 1 - length;
+        }
+    }
+    for (size_t key = 0; key < size; key++)
+    {
+        if (counts[key] != 0 && counts[key] >= min_count)
+        {
+            survivors->items[survivors->len++] = (Survivor){offsets[key], counts[key]};
+        }
+    }
+
+    free(counts);
+    free(offsets);
+    return true;
+}
+
+static bool count_packed(Survivors *survivors, const unsigned char *data, size_t data_len,
+                         size_t length, size_t min_count)
+{
+    Table table = {0};
+    uint64_t key = 0;
+    uint64_t key_mask = length == 8 ? UINT64_MAX : ((uint64_t)1 << (8 * length)) - 1;
+    bool ok = true;
+    for (size_t i = 0; i < data_len && ok; i++)
+    {
+        key = ((key << 8) | data[i]) & key_mask;
+        if (i + 1 >= length)
+        {
+            ok = table_add(&table, key, NULL, i + 1 - length, length);
+        }
+    }
+    ok = ok && survivors_from_table(survivors, &table, min_count);
+    free(table.entries);
+    return ok;
+}
+
+static bool count_hashed(Survivors *survivors, const unsigned char *data, size_t data_len,
+                         size_t length, size_t min_count)
+{
+    Table table = {0};
+    uint64_t hash = 0, top = 1;
+    for (size_t k = 0; k < length && k < data_len; k++)
+    {
+        hash = hash * HASH_BASE + data[k];
+        if (k > 0)
+        {
+            top *= HASH_BASE;
+        }
+    }
+    bool ok = true;
+    for (size_t i = 0; i + length <= data_len && ok; i++)
+    {
+        if (i > 0)
+        {
+            hash = (hash - data[i - 1] * top) * HASH_BASE + data[i + length - 1];
+        }
+        ok = table_add(&table, hash, data, i, length);
+    }
+    ok = ok && survivors_from_table(survivors, &table, min_count);
+    free(table.entries);
+    return ok;
+}
+
+static int compare_survivors(const void *a, const void *b)
+{
+    size_t x = ((const Survivor *)a)->offset, y = ((const Survivor *)b)->offset;
+    return (x > y) - (x < y);
+}
+
+static PyObject *uint64_to_array(const uint64_t *items, size_t len)
+{
+    PyObject *array = PyObject_CallFunction(array_type, "s", "Q");
+    if (!array || len == 0)
+    {
+        return array;
+    }
+    PyObject *view = PyMemoryView_FromMemory((char *)items, len * sizeof(uint64_t), PyBUF_READ);
+    PyObject *result = view ? PyObject_CallMethod(array, "frombytes", "O", view) : NULL;
+    Py_XDECREF(view);
+    if (!result)
+    {
+        Py_DECREF(array);
+        return NULL;
+    }
+    Py_DECREF(result);
+    return array;
+}
+
+static PyObject *counts_to_array(const Survivors *survivors)
+{
+    uint64_t *counts = malloc((survivors->len ? survivors->len : 1) * sizeof(uint64_t));
+    if (!counts)
+    {
+        return PyErr_NoMemory();
+    }
+    for (size_t i = 0; i < survivors->len; i++)
+    {
+        counts[i] = survivors->items[i].count;
+    }
+    PyObject *array = uint64_to_array(counts, survivors->len);
+    free(counts);
+    return array;
+}
+
 static PyObject *count_ngrams(PyObject *self, PyObject *args)
 {
-    const char *data;
-    Py_ssize_t data_len;
+    Py_buffer buffer;
     int length;
-    if (!PyArg_ParseTuple(args, "y#i", &data, &data_len, &length))
+    Py_ssize_t min_count = 1;
+    if (!PyArg_ParseTuple(args, "y*i|n", &buffer, &length, &min_count))
+    {
+        return NULL;
+    }
+    if (length <= 0)
     {
-        goto err;
+        PyBuffer_Release(&buffer);
+        PyErr_SetString(PyExc_ValueError, "n-gram length must be positive");
+        return NULL;
     }
+    const unsigned char *data = buffer.buf;
+    size_t data_len = buffer.len;
+    size_t threshold = min_count > 1 ? min_count : 1;
 
-    PyObject *counts = PyDict_New();
+    Survivors survivors = {0};
+    bool ok;
+    Py_BEGIN_ALLOW_THREADS;
+    if (length <= MAX_DIRECT_LEN)
+    {
+        ok = count_direct(&survivors, data, data_len, length, threshold);
+    }
+    else if (length <= MAX_PACKED_LEN)
+    {
+        ok = count_packed(&survivors, data, data_len, length, threshold);
+    }
+    else
+    {
+        ok = count_hashed(&survivors, data, data_len, length, threshold);
+    }
+    if (ok)
+    {
+        qsort(survivors.items, survivors.len, sizeof(Survivor), compare_survivors);
+    }
+    Py_END_ALLOW_THREADS;
+
+    PyObject *result = NULL;
+    if (!ok)
+    {
+        PyErr_NoMemory();
+        goto done;
+    }
+
+    PyObject *ngrams = PyBytes_FromStringAndSize(NULL, survivors.len * length);
+    if (!ngrams)
+    {
+        goto done;
+    }
+    char *out = PyBytes_AS_STRING(ngrams);
+    for (size_t i = 0; i < survivors.len; i++)
+    {
+        memcpy(out + i * length, data + survivors.items[i].offset, length);
+    }
+    PyObject *counts = counts_to_array(&survivors);
     if (!counts)
     {
-        goto err;
+        Py_DECREF(ngrams);
+        goto done;
+    }
+    result = Py_BuildValue("(NN)", ngrams, counts);
+
+done:
+    free(survivors.items);
+    PyBuffer_Release(&buffer);
+    return result;
+}
+
+/*
+ * Space-Saving summaries.
+ *
+ * A summary monitors at most `capacity` n-grams. An unmonitored n-gram takes
+ * over the monitored n-gram with the lowest count and inherits that count as
+ * its error, so a count never underestimates and overestimates by at most its
+ * error. Monitored n-grams are kept in a min-heap by count and found through an
+ * open addressing table of slots. Summaries of different inputs are merged as
+ * described in "Mergeable Summaries" by Agarwal et al.
+ */
+
+#define MAX_SUMMARY_CAPACITY (1 << 28)
+
+typedef struct
+{
+    PyObject_HEAD
+    Py_ssize_t n;
+    Py_ssize_t capacity;
+    Py_ssize_t size;
+    unsigned char *keys; // capacity * n bytes
+    uint64_t *hashes;
+    uint64_t *counts;
+    uint64_t *errors;
+    int32_t *heap;       // slots ordered by count
+    int32_t *heap_index; // heap position of each slot
+    int32_t *table;      // -1 marks an empty bucket
+    size_t table_mask;
+    // held while the tables are used, since update releases the GIL
+    PyThread_type_lock lock;
+} SummaryObject;
+
+typedef struct
+{
+    Py_ssize_t index;
+    uint64_t count;
+    uint64_t error;
+} Candidate;
+
+static uint64_t hash_ngram(const unsigned char *key, Py_ssize_t n)
+{
+    uint64_t hash = 0;
+    for (Py_ssize_t k = 0; k < n; k++)
+    {
+        hash = hash * HASH_BASE + key[k];
+    }
+    return hash;
+}
+
+static inline void heap_swap(SummaryObject *s, Py_ssize_t a, Py_ssize_t b)
+{
+    int32_t slot = s->heap[a];
+    s->heap[a] = s->heap[b];
+    s->heap[b] = slot;
+    s->heap_index[s->heap[a]] = a;
+    s->heap_index[s->heap[b]] = b;
+}
+
+static void heap_sift_up(SummaryObject *s, Py_ssize_t i)
+{
+    while (i > 0)
+    {
+        Py_ssize_t parent = (i - 1) / 2;
+        if (s->counts[s->heap[i]] >= s->counts[s->heap[parent]])
+        {
+            break;
+        }
+        heap_swap(s, i, parent);
+        i = parent;
+    }
+}
+
+static void heap_sift_down(SummaryObject *s, Py_ssize_t i)
+{
+    while (true)
+    {
+        Py_ssize_t smallest = i, left = 2 * i + 1, right = 2 * i + 2;
+        if (left < s->size && s->counts[s->heap[left]] < s->counts[s->heap[smallest]])
+        {
+            smallest = left;
+        }
+        if (right < s->size && s->counts[s->heap[right]] < s->counts[s->heap[smallest]])
+        {
+            smallest = right;
+        }
+        if (smallest == i)
+        {
+            break;
+        }
+        heap_swap(s, i, smallest);
+        i = smallest;
+    }
+}
+
+static uint64_t summary_floor(const SummaryObject *s)
+{
+    // the highest possible count of an unmonitored n-gram
+    return s->size == s->capacity ? s->counts[s->heap[0]] : 0;
+}
+
+static int32_t summary_find(const SummaryObject *s, uint64_t hash, const unsigned char *key,
+                            size_t *bucket)
+{
+    size_t b = mix(hash) & s->table_mask;
+    while (s->table[b] >= 0)
+    {
+        int32_t slot = s->table[b];
+        if (s->hashes[slot] == hash && memcmp(s->keys + slot * s->n, key, s->n) == 0)
+        {
+            break;
+        }
+        b = (b + 1) & s->table_mask;
     }
+    *bucket = b;
+    return s->table[b];
+}
 
-    for (size_t i = 0; i < data_len - length; i += 1)
+static void summary_unlink(SummaryObject *s, int32_t slot)
+{
+    size_t hole;
+    summary_find(s, s->hashes[slot], s->keys + slot * s->n, &hole);
+    // shift back the following entries which may no longer be reachable
+    for (size_t j = (hole + 1) & s->table_mask; s->table[j] >= 0; j = (j + 1) & s->table_mask)
     {
-        PyObject *ngram = PyBytes_FromStringAndSize(data + i, length);
-        if (!ngram)
+        size_t home = mix(s->hashes[s->table[j]]) & s->table_mask;
+        bool reachable = hole <= j ? (hole < home && home <= j) : (hole < home || home <= j);
+        if (!reachable)
         {
-            goto err;
+            s->table[hole] = s->table[j];
+            hole = j;
         }
+    }
+    s->table[hole] = -1;
+}
+
+static void summary_set(SummaryObject *s, int32_t slot, size_t bucket, uint64_t hash,
+                        const unsigned char *key, uint64_t count, uint64_t error)
+{
+    memcpy(s->keys + slot * s->n, key, s->n);
+    s->hashes[slot] = hash;
+    s->counts[slot] = count;
+    s->errors[slot] = error;
+    s->table[bucket] = slot;
+}
+
+static void summary_insert(SummaryObject *s, size_t bucket, uint64_t hash,
+                           const unsigned char *key, uint64_t count, uint64_t error)
+{
+    int32_t slot = s->size++;
+    summary_set(s, slot, bucket, hash, key, count, error);
+    s->heap[slot] = slot;
+    s->heap_index[slot] = slot;
+    heap_sift_up(s, slot);
+}
+
+static void summary_replace_min(SummaryObject *s, uint64_t hash, const unsigned char *key,
+                                uint64_t count, uint64_t error)
+{
+    int32_t slot = s->heap[0];
+    size_t bucket;
+    summary_unlink(s, slot);
+    summary_find(s, hash, key, &bucket);
+    summary_set(s, slot, bucket, hash, key, count, error);
+    heap_sift_down(s, 0);
+}
+
+static void summary_update(SummaryObject *s, const unsigned char *data, size_t data_len)
+{
+    size_t n = s->n;
+    if (n > data_len)
+    {
+        return;
+    }
+    uint64_t hash = 0, top = 1;
+    for (size_t k = 0; k < n; k++)
+    {
+        hash = hash * HASH_BASE + data[k];
+        if (k > 0)
+        {
+            top *= HASH_BASE;
+        }
+    }
+    for (size_t i = 0; i + n <= data_len; i++)
+    {
+        if (i > 0)
+        {
+            hash = (hash - data[i - 1] * top) * HASH_BASE + data[i + n - 1];
+        }
+        size_t bucket;
+        int32_t slot = summary_find(s, hash, data + i, &bucket);
+        if (slot >= 0)
+        {
+            s->counts[slot]++;
+            heap_sift_down(s, s->heap_index[slot]);
+        }
+        else if (s->size < s->capacity)
+        {
+            summary_insert(s, bucket, hash, data + i, 1, 0);
+        }
+        else
+        {
+            uint64_t min = s->counts[s->heap[0]];
+            summary_replace_min(s, hash, data + i, min + 1, min);
+        }
+    }
+}
 
-        PyObject *item = PyDict_GetItem(counts, ngram);
-        long value = item ? PyLong_AsLong(item) : 0;
-        PyDict_SetItem(counts, ngram, PyLong_FromLong(value + 1));
-        Py_DECREF(ngram);
+static void summary_free_tables(SummaryObject *self)
+{
+    free(self->keys);
+    free(self->hashes);
+    free(self->counts);
+    free(self->errors);
+    free(self->heap);
+    free(self->heap_index);
+    free(self->table);
+    self->keys = NULL;
+    self->hashes = NULL;
+    self->counts = NULL;
+    self->errors = NULL;
+    self->heap = NULL;
+    self->heap_index = NULL;
+    self->table = NULL;
+}
+
+static void summary_dealloc(SummaryObject *self)
+{
+    summary_free_tables(self);
+    if (self->lock)
+    {
+        PyThread_free_lock(self->lock);
+    }
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static PyObject *summary_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    SummaryObject *self = (SummaryObject *)PyType_GenericNew(type, args, kwds);
+    if (!self)
+    {
+        return NULL;
     }
+    self->lock = PyThread_allocate_lock();
+    if (!self->lock)
+    {
+        Py_DECREF(self);
+        return PyErr_NoMemory();
+    }
+    return (PyObject *)self;
+}
+
+/*
+ * Locks a summary for a method, and fails instead of waiting when another
+ * thread uses it, or when the summary was created without __init__.
+ */
+static int summary_acquire(SummaryObject *self)
+{
+    if (!self->keys)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "summary is not initialized");
+        return -1;
+    }
+    if (!PyThread_acquire_lock(self->lock, NOWAIT_LOCK))
+    {
+        PyErr_SetString(PyExc_RuntimeError, "summary is used by another thread");
+        return -1;
+    }
+    return 0;
+}
 
-ok:
-    return counts;
-err:
-    if (counts)
+static int summary_init(SummaryObject *self, PyObject *args, PyObject *kwds)
+{
+    Py_ssize_t n, capacity;
+    if (!PyArg_ParseTuple(args, "nn", &n, &capacity))
+    {
+        return -1;
+    }
+    if (n <= 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "n-gram length must be positive");
+        return -1;
+    }
+    if (capacity <= 0 || capacity > MAX_SUMMARY_CAPACITY)
+    {
+        PyErr_SetString(PyExc_ValueError, "capacity must be between 1 and 2**28");
+        return -1;
+    }
+    if (self->keys)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "summary is already initialized");
+        return -1;
+    }
+
+    size_t table_size = 1;
+    while (table_size < (size_t)capacity * 2)
+    {
+        table_size *= 2;
+    }
+    self->n = n;
+    self->capacity = capacity;
+    self->size = 0;
+    self->keys = malloc(capacity * n);
+    self->hashes = malloc(capacity * sizeof(uint64_t));
+    self->counts = malloc(capacity * sizeof(uint64_t));
+    self->errors = malloc(capacity * sizeof(uint64_t));
+    self->heap = malloc(capacity * sizeof(int32_t));
+    self->heap_index = malloc(capacity * sizeof(int32_t));
+    self->table = malloc(table_size * sizeof(int32_t));
+    self->table_mask = table_size - 1;
+    if (!self->keys || !self->hashes || !self->counts || !self->errors || !self->heap ||
+        !self->heap_index || !self->table)
+    {
+        summary_free_tables(self);
+        PyErr_NoMemory();
+        return -1;
+    }
+    memset(self->table, 0xFF, table_size * sizeof(int32_t));
+    return 0;
+}
+
+static PyObject *summary_update_method(SummaryObject *self, PyObject *args)
+{
+    Py_buffer data;
+    if (!PyArg_ParseTuple(args, "y*", &data))
+    {
+        return NULL;
+    }
+    if (summary_acquire(self) < 0)
     {
-        Py_DECREF(counts);
+        PyBuffer_Release(&data);
+        return NULL;
     }
-    return NULL;
+    Py_BEGIN_ALLOW_THREADS;
+    summary_update(self, data.buf, data.len);
+    Py_END_ALLOW_THREADS;
+    PyThread_release_lock(self->lock);
+    PyBuffer_Release(&data);
+    Py_RETURN_NONE;
 }
 
+static int compare_candidates(const void *a, const void *b)
+{
+    const Candidate *x = a, *y = b;
+    if (x->count != y->count)
+    {
+        return x->count < y->count ? 1 : -1;
+    }
+    if (x->error != y->error)
+    {
+        return x->error < y->error ? -1 : 1;
+    }
+    return (x->index > y->index) - (x->index < y->index);
+}
+
+static PyObject *summary_merge(SummaryObject *self, PyObject *args)
+{
+    Py_buffer ngrams, counts, errors;
+    unsigned long long other_floor;
+    if (!PyArg_ParseTuple(args, "y*y*y*K", &ngrams, &counts, &errors, &other_floor))
+    {
+        return NULL;
+    }
+    if (summary_acquire(self) < 0)
+    {
+        PyBuffer_Release(&ngrams);
+        PyBuffer_Release(&counts);
+        PyBuffer_Release(&errors);
+        return NULL;
+    }
+
+    PyObject *result = NULL;
+    bool *merged = NULL;
+    Candidate *candidates = NULL;
+    Py_ssize_t num_items = ngrams.len / self->n;
+    if (ngrams.len % self->n != 0 || counts.len != num_items * (Py_ssize_t)sizeof(uint64_t) ||
+        errors.len != counts.len)
+    {
+        PyErr_SetString(PyExc_ValueError, "invalid summary items");
+        goto done;
+    }
+    merged = calloc(self->capacity, sizeof(bool));
+    candidates = malloc((num_items ? num_items : 1) * sizeof(Candidate));
+    if (!merged || !candidates)
+    {
+        PyErr_NoMemory();
+        goto done;
+    }
+
+    // n-grams missing from either summary may have occurred up to its floor
+    uint64_t floor = summary_floor(self);
+    const unsigned char *keys = ngrams.buf;
+    const uint64_t *other_counts = counts.buf, *other_errors = errors.buf;
+    Py_ssize_t num_candidates = 0;
+    for (Py_ssize_t i = 0; i < num_items; i++)
+    {
+        size_t bucket;
+        int32_t slot = summary_find(self, hash_ngram(keys + i * self->n, self->n),
+                                    keys + i * self->n, &bucket);
+        if (slot >= 0)
+        {
+            self->counts[slot] += other_counts[i];
+            self->errors[slot] += other_errors[i];
+            merged[slot] = true;
+        }
+        else
+        {
+            candidates[num_candidates++] =
+                (Candidate){i, other_counts[i] + floor, other_errors[i] + floor};
+        }
+    }
+    for (Py_ssize_t slot = 0; slot < self->size; slot++)
+    {
+        if (!merged[slot])
+        {
+            self->counts[slot] += other_floor;
+            self->errors[slot] += other_floor;
+        }
+    }
+    for (Py_ssize_t i = self->size / 2 - 1; i >= 0; i--)
+    {
+        heap_sift_down(self, i);
+    }
+
+    // keep the n-grams with the highest counts
+    qsort(candidates, num_candidates, sizeof(Candidate), compare_candidates);
+    for (Py_ssize_t i = 0; i < num_candidates; i++)
+    {
+        const Candidate *c = &candidates[i];
+        const unsigned char *key = keys + c->index * self->n;
+        uint64_t hash = hash_ngram(key, self->n);
+        if (self->size < self->capacity)
+        {
+            size_t bucket;
+            summary_find(self, hash, key, &bucket);
+            summary_insert(self, bucket, hash, key, c->count, c->error);
+        }
+        else if (c->count > self->counts[self->heap[0]])
+        {
+            summary_replace_min(self, hash, key, c->count, c->error);
+        }
+        else
+        {
+            break;
+        }
+    }
+    result = Py_None;
+    Py_INCREF(result);
+
+done:
+    PyThread_release_lock(self->lock);
+    free(merged);
+    free(candidates);
+    PyBuffer_Release(&ngrams);
+    PyBuffer_Release(&counts);
+    PyBuffer_Release(&errors);
+    return result;
+}
+
+static PyObject *summary_items(SummaryObject *self, PyObject *Py_UNUSED(ignored))
+{
+    if (summary_acquire(self) < 0)
+    {
+        return NULL;
+    }
+    Candidate *items = malloc((self->size ? self->size : 1) * sizeof(Candidate));
+    uint64_t *counts = malloc((self->size ? self->size : 1) * sizeof(uint64_t));
+    uint64_t *errors = malloc((self->size ? self->size : 1) * sizeof(uint64_t));
+    PyObject *ngrams = PyBytes_FromStringAndSize(NULL, self->size * self->n);
+    PyObject *counts_array = NULL, *errors_array = NULL, *result = NULL;
+    if (!items || !counts || !errors)
+    {
+        PyErr_NoMemory();
+        goto done;
+    }
+    if (!ngrams)
+    {
+        goto done;
+    }
+
+    for (Py_ssize_t slot = 0; slot < self->size; slot++)
+    {
+        items[slot] = (Candidate){slot, self->counts[slot], self->errors[slot]};
+    }
+    qsort(items, self->size, sizeof(Candidate), compare_candidates);
+    char *out = PyBytes_AS_STRING(ngrams);
+    for (Py_ssize_t i = 0; i < self->size; i++)
+    {
+        memcpy(out + i * self->n, self->keys + items[i].index * self->n, self->n);
+        counts[i] = items[i].count;
+        errors[i] = items[i].error;
+    }
+    counts_array = uint64_to_array(counts, self->size);
+    if (!counts_array)
+    {
+        goto done;
+    }
+    errors_array = uint64_to_array(errors, self->size);
+    if (!errors_array)
+    {
+        goto done;
+    }
+    result = Py_BuildValue("(OOOK)", ngrams, counts_array, errors_array,
+                           (unsigned long long)summary_floor(self));
+
+done:
+    PyThread_release_lock(self->lock);
+    Py_XDECREF(ngrams);
+    Py_XDECREF(counts_array);
+    Py_XDECREF(errors_array);
+    free(items);
+    free(counts);
+    free(errors);
+    return result;
+}
+
+static PyMethodDef summary_methods[] = {
+    {"update", (PyCFunction)summary_update_method, METH_VARARGS,
+     "Counts the n-grams of the data."},
+    {"merge", (PyCFunction)summary_merge, METH_VARARGS,
+     "Merges the items of another summary into this one."},
+    {"items", (PyCFunction)summary_items, METH_NOARGS,
+     "Returns the monitored n-grams as their concatenated bytes, an array of their "
+     "counts, an array of their errors and the highest possible count of any other "
+     "n-gram, ordered by decreasing count."},
+    {NULL, NULL, 0, NULL}};
+
+static PyTypeObject SummaryType = {
+    PyVarObject_HEAD_INIT(NULL, 0).tp_name = "reven.fast.ngram.Summary",
+    .tp_doc = "Space-Saving summary of the most frequent n-grams.",
+    .tp_basicsize = sizeof(SummaryObject),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = summary_new,
+    .tp_init = (initproc)summary_init,
+    .tp_dealloc = (destructor)summary_dealloc,
+    .tp_methods = summary_methods,
+};
+
 static PyMethodDef module_methods[] = {
-    {"count_ngrams", count_ngrams, METH_VARARGS}, {NULL, NULL, 0, NULL}};
+    {"count_ngrams", count_ngrams, METH_VARARGS,
+     "Counts the n-grams of the data and returns the ones occurring at least min_count "
+     "times as a pair of their concatenated bytes and an array of their counts, in "
+     "order of first appearance."},
+    {NULL, NULL, 0, NULL}};
 
 static struct PyModuleDef ngram = {PyModuleDef_HEAD_INIT, "ngram",
                                    "Fast ngram operations in C", -1, module_methods};
 
-PyMODINIT_FUNC PyInit_ngram() { return PyModule_Create(&ngram); }
+PyMODINIT_FUNC PyInit_ngram()
+{
+    if (!array_type)
+    {
+        PyObject *array_module = PyImport_ImportModule("array");
+        if (!array_module)
+        {
+            return NULL;
+        }
+        array_type = PyObject_GetAttrString(array_module, "array");
+        Py_DECREF(array_module);
+        if (!array_type)
+        {
+            return NULL;
+        }
+    }
+    if (PyType_Ready(&SummaryType) < 0)
+    {
+        return NULL;
+    }
+    PyObject *module = PyModule_Create(&ngram);
+    if (!module)
+    {
+        return NULL;
+    }
+    Py_INCREF(&SummaryType);
+    if (PyModule_AddObject(module, "Summary", (PyObject *)&SummaryType) < 0)
+    {
+        Py_DECREF(&SummaryType);
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
+}
@@ -3,83 +3,815 @@
 #include <math.h>
 #include <object.h>
 #include <stdbool.h>
+#include <stdint.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <string.h>
 
-static PyObject *pattern_search(PyObject *self, PyObject *args)
+/*
+ * memmem is a GNU and BSD extension, which MSVC and some C libraries do not
+ * provide. The fallback finds candidates for the first byte with memchr and
+ * compares the rest with memcmp.
+ */
+#if !defined(HAVE_MEMMEM) && !defined(__GLIBC__) && !defined(__APPLE__) &&     \
+    !defined(__FreeBSD__) && !defined(__OpenBSD__) && !defined(__NetBSD__)
+static void *portable_memmem(const void *haystack, size_t haystack_len,
+                             const void *needle, size_t needle_len)
 {
-    const char *pattern;
-    Py_ssize_t pattern_len;
-    const char *data;
-    Py_ssize_t data_len;
-    int step;
-    if (!PyArg_ParseTuple(args, "y#y#i", &pattern, &pattern_len, &data,
-                          &data_len, &step))
+    const unsigned char *at = haystack;
+    const unsigned char *end = at + haystack_len;
+    if (needle_len == 0)
+    {
+        return (void *)at;
+    }
+    while ((size_t)(end - at) >= needle_len)
+    {
+        at = memchr(at, *(const unsigned char *)needle,
+                    end - at - needle_len + 1);
+        if (!at)
+        {
+            return NULL;
+        }
+        if (memcmp(at, needle, needle_len) == 0)
+        {
+            return (void *)at;
+        }
+        at++;
+    }
+    return NULL;
+}
+#define memmem portable_memmem
+#endif
+
+/*
+ * Positions are collected into a growable array of 64 bit integers, which is
+ * handed to Python as an array('Q'). When only the number of matches is needed
+ * the positions are counted without being stored.
+ */
+
+typedef struct
+{
+    uint64_t *items;
+    size_t len;
+    size_t cap;
+    bool count_only;
+} Positions;
+
+static PyObject *array_type = NULL;
+
+static bool positions_push(Positions *p, uint64_t value)
+{
+    if (p->count_only)
     {
+        p->len++;
+        return true;
+    }
+    if (p->len == p->cap)
+    {
+        size_t cap = p->cap ? p->cap * 2 : 16;
+        uint64_t *items = realloc(p->items, cap * sizeof(uint64_t));
+        if (!items)
+        {
+            return false;
+        }
+        p->items = items;
+        p->cap = cap;
+    }
+    p->items[p->len++] = value;
+    return true;
+}
+
+static int compare_positions(const void *a, const void *b)
+{
+    uint64_t x = *(const uint64_t *)a, y = *(const uint64_t *)b;
+    return (x > y) - (x < y);
+}
+
+static PyObject *positions_to_array(const Positions *p)
+{
+    if (p->count_only)
+    {
+        return PyLong_FromSize_t(p->len);
+    }
+    PyObject *array = PyObject_CallFunction(array_type, "s", "Q");
+    if (!array || p->len == 0)
+    {
+        return array;
+    }
+    PyObject *view = PyMemoryView_FromMemory((char *)p->items, p->len * sizeof(uint64_t),
+                                             PyBUF_READ);
+    PyObject *result = view ? PyObject_CallMethod(array, "frombytes", "O", view) : NULL;
+    Py_XDECREF(view);
+    if (!result)
+    {
+        Py_DECREF(array);
         return NULL;
     }
+    Py_DECREF(result);
+    return array;
+}
+
+/*
+ * Compiled patterns.
+ *
+ * A pattern is compiled into one (byte mode) or two (nibble mode, one per
+ * nibble alignment) variants made of value/mask bytes. The longest run of
+ * fully fixed bytes in a variant is used as an anchor which is located with
+ * memmem before the remainder is verified with the mask. Short patterns
+ * with a weak anchor are matched with a bit-parallel shift-and instead.
+ */
 
-    PyObject *indices = PyList_New(0);
-    if (pattern_len > data_len * 2)
+#define MAX_ANCHOR_LEN 16
+#define MIN_ANCHOR_LEN 4
+#define SHIFT_AND_MAX_LEN 64
+
+typedef struct
+{
+    Py_ssize_t pattern;
+    int shift;
+    Py_ssize_t nibbles;
+    Py_ssize_t len;
+    unsigned char *value;
+    unsigned char *mask;
+    Py_ssize_t anchor;
+    Py_ssize_t anchor_len;
+} Variant;
+
+static bool variant_init(Variant *v, Py_ssize_t pattern, const unsigned char *value,
+                         const unsigned char *mask, Py_ssize_t len, Py_ssize_t nibbles,
+                         int shift)
+{
+    Py_ssize_t vlen = shift ? len + 1 : len;
+    v->pattern = pattern;
+    v->shift = shift;
+    v->nibbles = nibbles;
+    v->value = calloc(vlen ? vlen * 2 : 1, 1);
+    if (!v->value)
+    {
+        return false;
+    }
+    v->mask = v->value + vlen;
+
+    for (Py_ssize_t i = 0; i < vlen; i++)
+    {
+        if (shift)
+        {
+            unsigned char prev_v = i > 0 ? value[i - 1] : 0, prev_m = i > 0 ? mask[i - 1] : 0;
+            unsigned char cur_v = i < len ? value[i] : 0, cur_m = i < len ? mask[i] : 0;
+            v->mask[i] = (prev_m & 0xF) << 4 | cur_m >> 4;
+            v->value[i] = ((prev_v & 0xF) << 4 | cur_v >> 4) & v->mask[i];
+        }
+        else
+        {
+            v->value[i] = value[i] & mask[i];
+            v->mask[i] = mask[i];
+        }
+    }
+    // trailing wildcards only matter for the bounds check, which uses nibbles
+    while (vlen > 0 && v->mask[vlen - 1] == 0)
     {
-        return indices;
+        vlen--;
     }
-    size_t iters = data_len * 2 - pattern_len + 1;
-    for (size_t i = 0; i < iters; i += step)
+    v->len = vlen;
+
+    Py_ssize_t best = 0, best_len = 0, run = 0;
+    for (Py_ssize_t i = 0; i < v->len; i++)
     {
-        bool matches = true;
-        for (size_t j = 0; j < pattern_len; j++)
+        run = v->mask[i] == 0xFF ? run + 1 : 0;
+        if (run > best_len)
         {
-            char a, b;
-            if (pattern[j] >= 'a' && pattern[j] <= 'f')
+            best = i - run + 1;
+            best_len = run;
+        }
+    }
+    v->anchor = best;
+    v->anchor_len = best_len > MAX_ANCHOR_LEN ? MAX_ANCHOR_LEN : best_len;
+    return true;
+}
+
+static inline bool variant_fits(const Variant *v, Py_ssize_t data_len, Py_ssize_t pos)
+{
+    return pos * 2 + v->shift + v->nibbles <= data_len * 2;
+}
+
+static bool variant_matches(const Variant *v, const unsigned char *data,
+                            Py_ssize_t data_len, Py_ssize_t pos)
+{
+    if (!variant_fits(v, data_len, pos))
+    {
+        return false;
+    }
+    for (Py_ssize_t k = 0; k < v->len; k++)
+    {
+        if ((data[pos + k] & v->mask[k]) != v->value[k])
+        {
+            return false;
+        }
+    }
+    return true;
+}
+
+// Appends the positions of a single variant in ascending order.
+static bool variant_search(const Variant *v, const unsigned char *data, Py_ssize_t data_len,
+                           int step, Positions *found)
+{
+    if (v->len == 0)
+    {
+        for (Py_ssize_t pos = 0; variant_fits(v, data_len, pos); pos++)
+        {
+            if (!positions_push(found, (2 * pos + v->shift) / step))
             {
-                a = pattern[j] - 'a' + 0xa;
+                return false;
             }
-            else if (pattern[j] >= '0' && pattern[j] <= '9')
+        }
+        return true;
+    }
+
+    if (v->anchor_len < MIN_ANCHOR_LEN && v->len <= SHIFT_AND_MAX_LEN)
+    {
+        uint64_t table[256] = {0};
+        for (Py_ssize_t k = 0; k < v->len; k++)
+        {
+            for (int c = 0; c < 256; c++)
             {
-                a = pattern[j] - '0';
+                if ((c & v->mask[k]) == v->value[k])
+                {
+                    table[c] |= (uint64_t)1 << k;
+                }
             }
-            else if (pattern[j] == '?')
+        }
+        uint64_t state = 0, last = (uint64_t)1 << (v->len - 1);
+        for (Py_ssize_t i = 0; i < data_len; i++)
+        {
+            state = ((state << 1) | 1) & table[data[i]];
+            if (state & last)
             {
-                continue;
+                Py_ssize_t pos = i + 1 - v->len;
+                if (variant_fits(v, data_len, pos) &&
+                    !positions_push(found, (2 * pos + v->shift) / step))
+                {
+                    return false;
+                }
             }
-            else
+        }
+        return true;
+    }
+
+    if (v->anchor_len == 0)
+    {
+        for (Py_ssize_t pos = 0; variant_fits(v, data_len, pos); pos++)
+        {
+            if (variant_matches(v, data, data_len, pos) &&
+                !positions_push(found, (2 * pos + v->shift) / step))
+            {
+                return false;
+            }
+        }
+        return true;
+    }
+
+    const unsigned char *anchor = v->value + v->anchor;
+    const unsigned char *at = data + v->anchor;
+    const unsigned char *end = data + data_len;
+    while (at + v->anchor_len <= end)
+    {
+        at = memmem(at, end - at, anchor, v->anchor_len);
+        if (!at)
+        {
+            break;
+        }
+        Py_ssize_t pos = at - data - v->anchor;
+        if (variant_matches(v, data, data_len, pos) &&
+            !positions_push(found, (2 * pos + v->shift) / step))
+        {
+            return false;
+        }
+        at++;
+    }
+    return true;
+}
+
+static PyObject *pattern_search(PyObject *self, PyObject *args)
+{
+    Py_buffer value, mask, buffer;
+    Py_ssize_t nibbles;
+    int step;
+    int count_only = 0;
+    if (!PyArg_ParseTuple(args, "y*y*ny*i|p", &value, &mask, &nibbles, &buffer, &step,
+                          &count_only))
+    {
+        return NULL;
+    }
+
+    PyObject *indices = NULL;
+    Variant variants[2] = {0};
+    Positions found[2] = {{.count_only = count_only}, {.count_only = count_only}};
+    int num_variants = 3 - step;
+    if (step != 1 && step != 2)
+    {
+        PyErr_SetString(PyExc_ValueError, "step must be 1 (nibble) or 2 (byte)");
+        goto done;
+    }
+    if (value.len != mask.len || nibbles > value.len * 2)
+    {
+        PyErr_SetString(PyExc_ValueError, "invalid compiled pattern");
+        goto done;
+    }
+    for (int shift = 0; shift < num_variants; shift++)
+    {
+        if (!variant_init(&variants[shift], 0, value.buf, mask.buf, value.len, nibbles, shift))
+        {
+            PyErr_NoMemory();
+            goto done;
+        }
+    }
+
+    bool ok = true;
+    Py_BEGIN_ALLOW_THREADS;
+    for (int shift = 0; shift < num_variants && ok; shift++)
+    {
+        ok = variant_search(&variants[shift], buffer.buf, buffer.len, step, &found[shift]);
+    }
+    // merge the positions of both nibble alignments
+    if (count_only)
+    {
+        found[0].len += found[1].len;
+    }
+    else if (ok && num_variants == 2 && found[1].len > 0)
+    {
+        Positions merged = {0};
+        size_t a = 0, b = 0;
+        while (ok && (a < found[0].len || b < found[1].len))
+        {
+            bool take_a = b >= found[1].len || (a < found[0].len && found[0].items[a] < found[1].items[b]);
+            ok = positions_push(&merged, take_a ? found[0].items[a++] : found[1].items[b++]);
+        }
+        free(found[0].items);
+        found[0] = merged;
+    }
+    Py_END_ALLOW_THREADS;
+
+    indices = ok ? positions_to_array(&found[0]) : PyErr_NoMemory();
+
+done:
+    for (int shift = 0; shift < 2; shift++)
+    {
+        free(variants[shift].value);
+        free(found[shift].items);
+    }
+    PyBuffer_Release(&value);
+    PyBuffer_Release(&mask);
+    PyBuffer_Release(&buffer);
+    return indices;
+}
+
+static PyObject *bytes_search(PyObject *self, PyObject *args)
+{
+    Py_buffer needle, buffer;
+    int count_only = 0;
+    if (!PyArg_ParseTuple(args, "y*y*|p", &needle, &buffer, &count_only))
+    {
+        return NULL;
+    }
+
+    Positions found = {.count_only = count_only};
+    bool ok = true;
+    Py_BEGIN_ALLOW_THREADS;
+    const char *data = buffer.buf;
+    const char *end = data + buffer.len;
+    for (const char *at = data; ok && at + needle.len <= end; at++)
+    {
+        at = memmem(at, end - at, needle.buf, needle.len);
+        if (!at)
+        {
+            break;
+        }
+        ok = positions_push(&found, at - data);
+    }
+    Py_END_ALLOW_THREADS;
+
+    PyBuffer_Release(&needle);
+    PyBuffer_Release(&buffer);
+    PyObject *indices = ok ? positions_to_array(&found) : PyErr_NoMemory();
+    free(found.items);
+    return indices;
+}
+
+/*
+ * Multi-pattern matching.
+ *
+ * The anchors of all variants are inserted into an Aho-Corasick automaton, and
+ * whenever an anchor is found the remainder of its variant is verified with
+ * the mask. Variants without any fixed byte are verified at every offset.
+ */
+
+typedef struct
+{
+    PyObject_HEAD
+    int step;
+    Py_ssize_t num_patterns;
+    Py_ssize_t num_variants;
+    Variant *variants;
+    Py_ssize_t num_unanchored;
+    Py_ssize_t *unanchored;
+    Py_ssize_t num_states;
+    int32_t *transitions;
+    Py_ssize_t *outputs_start;
+    Py_ssize_t *outputs;
+} AutomatonObject;
+
+static void automaton_free_tables(AutomatonObject *self)
+{
+    if (self->variants)
+    {
+        for (Py_ssize_t i = 0; i < self->num_variants; i++)
+        {
+            free(self->variants[i].value);
+        }
+        free(self->variants);
+    }
+    free(self->unanchored);
+    free(self->transitions);
+    free(self->outputs_start);
+    free(self->outputs);
+    self->variants = NULL;
+    self->unanchored = NULL;
+    self->transitions = NULL;
+    self->outputs_start = NULL;
+    self->outputs = NULL;
+    self->num_patterns = 0;
+    self->num_variants = 0;
+    self->num_unanchored = 0;
+    self->num_states = 0;
+}
+
+static void automaton_dealloc(AutomatonObject *self)
+{
+    automaton_free_tables(self);
+    Py_TYPE(self)->tp_free((PyObject *)self);
+}
+
+static int automaton_add_variant(AutomatonObject *self, Py_ssize_t pattern,
+                                 const unsigned char *value, const unsigned char *mask,
+                                 Py_ssize_t len, Py_ssize_t nibbles, int shift)
+{
+    if (!variant_init(&self->variants[self->num_variants], pattern, value, mask, len,
+                      nibbles, shift))
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
+    self->num_variants++;
+    return 0;
+}
+
+static int automaton_build(AutomatonObject *self)
+{
+    Py_ssize_t max_states = 1;
+    for (Py_ssize_t i = 0; i < self->num_variants; i++)
+    {
+        max_states += self->variants[i].anchor_len;
+    }
+
+    int32_t *fail = calloc(max_states, sizeof(int32_t));
+    int32_t *queue = malloc(max_states * sizeof(int32_t));
+    Py_ssize_t *counts = calloc(max_states, sizeof(Py_ssize_t));
+    // per-state linked lists of the variants whose anchor ends in that state
+    Py_ssize_t *heads = malloc(max_states * sizeof(Py_ssize_t));
+    Py_ssize_t *links = malloc((self->num_variants + 1) * sizeof(Py_ssize_t));
+    self->transitions = malloc(max_states * 256 * sizeof(int32_t));
+    self->unanchored = malloc((self->num_variants + 1) * sizeof(Py_ssize_t));
+    self->outputs_start = malloc((max_states + 1) * sizeof(Py_ssize_t));
+    if (!fail || !queue || !counts || !heads || !links || !self->transitions ||
+        !self->unanchored || !self->outputs_start)
+    {
+        goto nomem;
+    }
+    memset(self->transitions, 0xFF, max_states * 256 * sizeof(int32_t));
+    for (Py_ssize_t s = 0; s < max_states; s++)
+    {
+        heads[s] = -1;
+    }
+
+    // build the trie of anchors
+    self->num_states = 1;
+    for (Py_ssize_t i = 0; i < self->num_variants; i++)
+    {
+        Variant *v = &self->variants[i];
+        if (v->anchor_len == 0)
+        {
+            self->unanchored[self->num_unanchored++] = i;
+            continue;
+        }
+        int32_t state = 0;
+        for (Py_ssize_t k = 0; k < v->anchor_len; k++)
+        {
+            int32_t *next = &self->transitions[state * 256 + v->value[v->anchor + k]];
+            if (*next < 0)
             {
-                goto err;
+                *next = self->num_states++;
             }
+            state = *next;
+        }
+        links[i] = heads[state];
+        heads[state] = i;
+        counts[state]++;
+    }
 
-            if ((i + j) % 2 == 0)
+    // breadth first construction of failure links and the complete transition table
+    Py_ssize_t head = 0, tail = 0;
+    for (int c = 0; c < 256; c++)
+    {
+        int32_t *next = &self->transitions[c];
+        if (*next < 0)
+        {
+            *next = 0;
+        }
+        else
+        {
+            fail[*next] = 0;
+            queue[tail++] = *next;
+        }
+    }
+    while (head < tail)
+    {
+        int32_t state = queue[head++];
+        for (int c = 0; c < 256; c++)
+        {
+            int32_t *next = &self->transitions[state * 256 + c];
+            if (*next < 0)
             {
-                b = (data[(i + j) / 2] & 0xF0) >> 4;
+                *next = self->transitions[fail[state] * 256 + c];
             }
             else
             {
-                b = (data[(i + j) / 2] & 0xF);
+                fail[*next] = self->transitions[fail[state] * 256 + c];
+                queue[tail++] = *next;
             }
-            if (a != b)
+        }
+    }
+
+    // flatten the outputs of every state, including those reachable via failure
+    // links, in breadth first order so that failure states are always complete
+    for (Py_ssize_t q = 0; q < tail; q++)
+    {
+        counts[queue[q]] += counts[fail[queue[q]]];
+    }
+    self->outputs_start[0] = 0;
+    for (Py_ssize_t s = 0; s < self->num_states; s++)
+    {
+        self->outputs_start[s + 1] = self->outputs_start[s] + counts[s];
+    }
+    self->outputs = malloc((self->outputs_start[self->num_states] + 1) * sizeof(Py_ssize_t));
+    if (!self->outputs)
+    {
+        goto nomem;
+    }
+    for (Py_ssize_t q = 0; q < tail; q++)
+    {
+        int32_t s = queue[q];
+        Py_ssize_t n = self->outputs_start[s];
+        for (Py_ssize_t i = heads[s]; i >= 0; i = links[i])
+        {
+            self->outputs[n++] = i;
+        }
+        for (Py_ssize_t k = self->outputs_start[fail[s]]; k < self->outputs_start[fail[s] + 1]; k++)
+        {
+            self->outputs[n++] = self->outputs[k];
+        }
+    }
+
+    free(fail);
+    free(queue);
+    free(counts);
+    free(heads);
+    free(links);
+    return 0;
+nomem:
+    free(fail);
+    free(queue);
+    free(counts);
+    free(heads);
+    free(links);
+    PyErr_NoMemory();
+    return -1;
+}
+
+static int automaton_init(AutomatonObject *self, PyObject *args, PyObject *kwds)
+{
+    PyObject *patterns;
+    int step;
+    if (!PyArg_ParseTuple(args, "Oi", &patterns, &step))
+    {
+        return -1;
+    }
+    if (step != 1 && step != 2)
+    {
+        PyErr_SetString(PyExc_ValueError, "step must be 1 (nibble) or 2 (byte)");
+        return -1;
+    }
+    if (self->variants)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "automaton is already initialized");
+        return -1;
+    }
+    PyObject *seq = PySequence_Fast(patterns, "patterns must be a sequence");
+    if (!seq)
+    {
+        return -1;
+    }
+
+    self->step = step;
+    self->num_patterns = PySequence_Fast_GET_SIZE(seq);
+    self->variants = calloc(self->num_patterns * (step == 1 ? 2 : 1) + 1, sizeof(Variant));
+    if (!self->variants)
+    {
+        PyErr_NoMemory();
+        goto error;
+    }
+
+    for (Py_ssize_t i = 0; i < self->num_patterns; i++)
+    {
+        const char *value, *mask;
+        Py_ssize_t value_len, mask_len, nibbles;
+        if (!PyArg_ParseTuple(PySequence_Fast_GET_ITEM(seq, i), "y#y#n", &value,
+                              &value_len, &mask, &mask_len, &nibbles))
+        {
+            goto error;
+        }
+        if (value_len != mask_len || nibbles > value_len * 2)
+        {
+            PyErr_SetString(PyExc_ValueError, "invalid compiled pattern");
+            goto error;
+        }
+        for (int shift = 0; shift < 3 - step; shift++)
+        {
+            if (automaton_add_variant(self, i, (const unsigned char *)value,
+                                      (const unsigned char *)mask, value_len, nibbles,
+                                      shift) < 0)
             {
-                matches = false;
-                break;
+                goto error;
             }
         }
-        if (matches)
+    }
+    if (automaton_build(self) < 0)
+    {
+        goto error;
+    }
+    Py_DECREF(seq);
+    return 0;
+error:
+    // leave the automaton uninitialized, so that it may be initialized again
+    automaton_free_tables(self);
+    Py_DECREF(seq);
+    return -1;
+}
+
+static PyObject *automaton_search(AutomatonObject *self, PyObject *args)
+{
+    Py_buffer data;
+    int count_only = 0;
+    if (!self->transitions)
+    {
+        PyErr_SetString(PyExc_RuntimeError, "automaton is not initialized");
+        return NULL;
+    }
+    if (!PyArg_ParseTuple(args, "y*|p", &data, &count_only))
+    {
+        return NULL;
+    }
+
+    Positions *found = calloc(self->num_patterns + 1, sizeof(Positions));
+    if (!found)
+    {
+        PyBuffer_Release(&data);
+        return PyErr_NoMemory();
+    }
+    for (Py_ssize_t p = 0; p < self->num_patterns; p++)
+    {
+        found[p].count_only = count_only;
+    }
+
+    bool ok = true;
+    const unsigned char *bytes = data.buf;
+    Py_ssize_t len = data.len;
+
+    Py_BEGIN_ALLOW_THREADS;
+    int32_t state = 0;
+    for (Py_ssize_t i = 0; i < len && ok; i++)
+    {
+        for (Py_ssize_t u = 0; u < self->num_unanchored; u++)
         {
-            PyList_Append(indices, PyLong_FromSize_t(i / step));
+            Variant *v = &self->variants[self->unanchored[u]];
+            if (variant_matches(v, bytes, len, i))
+            {
+                ok = ok && positions_push(&found[v->pattern], (2 * i + v->shift) / self->step);
+            }
+        }
+
+        state = self->transitions[state * 256 + bytes[i]];
+        for (Py_ssize_t k = self->outputs_start[state]; k < self->outputs_start[state + 1]; k++)
+        {
+            Variant *v = &self->variants[self->outputs[k]];
+            Py_ssize_t pos = i + 1 - v->anchor_len - v->anchor;
+            if (pos >= 0 && variant_matches(v, bytes, len, pos))
+            {
+                ok = ok && positions_push(&found[v->pattern], (2 * pos + v->shift) / self->step);
+            }
         }
     }
-ok:
-    return indices;
-err:
-    PyErr_SetString(PyExc_ValueError, "Unexpected character in pattern");
-    Py_DECREF(indices);
-    return NULL;
+    if (self->step == 1 && !count_only)
+    {
+        for (Py_ssize_t p = 0; p < self->num_patterns; p++)
+        {
+            qsort(found[p].items, found[p].len, sizeof(uint64_t), compare_positions);
+        }
+    }
+    Py_END_ALLOW_THREADS;
+
+    PyBuffer_Release(&data);
+
+    PyObject *result = ok ? PyList_New(self->num_patterns) : NULL;
+    for (Py_ssize_t p = 0; result && p < self->num_patterns; p++)
+    {
+        PyObject *positions = positions_to_array(&found[p]);
+        if (!positions)
+        {
+            Py_CLEAR(result);
+            break;
+        }
+        PyList_SET_ITEM(result, p, positions);
+    }
+
+    for (Py_ssize_t p = 0; p < self->num_patterns; p++)
+    {
+        free(found[p].items);
+    }
+    free(found);
+    if (!ok)
+    {
+        return PyErr_NoMemory();
+    }
+    return result;
 }
 
+static PyMethodDef automaton_methods[] = {
+    {"search", (PyCFunction)automaton_search, METH_VARARGS,
+     "Returns the positions, or the number of matches if count_only is set, of every "
+     "pattern within the data."},
+    {NULL, NULL, 0, NULL}};
+
+static PyTypeObject AutomatonType = {
+    PyVarObject_HEAD_INIT(NULL, 0).tp_name = "reven.fast.pattern.Automaton",
+    .tp_doc = "Compiled set of patterns searched in a single pass.",
+    .tp_basicsize = sizeof(AutomatonObject),
+    .tp_itemsize = 0,
+    .tp_flags = Py_TPFLAGS_DEFAULT,
+    .tp_new = PyType_GenericNew,
+    .tp_init = (initproc)automaton_init,
+    .tp_dealloc = (destructor)automaton_dealloc,
+    .tp_methods = automaton_methods,
+};
+
 static PyMethodDef module_methods[] = {
-    {"pattern_search", pattern_search, METH_VARARGS}, {NULL, NULL, 0, NULL}};
+    {"pattern_search", pattern_search, METH_VARARGS},
+    {"bytes_search", bytes_search, METH_VARARGS},
+    {NULL, NULL, 0, NULL}};
 
 static struct PyModuleDef pattern = {PyModuleDef_HEAD_INIT, "pattern",
                                      "Fast pattern operations in C", -1, module_methods};
 
-PyMODINIT_FUNC PyInit_pattern() { return PyModule_Create(&pattern); }
+PyMODINIT_FUNC PyInit_pattern()
+{
+    if (PyType_Ready(&AutomatonType) < 0)
+    {
+        return NULL;
+    }
+    if (!array_type)
+    {
+        PyObject *array_module = PyImport_ImportModule("array");
+        if (!array_module)
+        {
+            return NULL;
+        }
+        array_type = PyObject_GetAttrString(array_module, "array");
+        Py_DECREF(array_module);
+        if (!array_type)
+        {
+            return NULL;
+        }
+    }
+    PyObject *module = PyModule_Create(&pattern);
+    if (!module)
+    {
+        return NULL;
+    }
+    Py_INCREF(&AutomatonType);
+    if (PyModule_AddObject(module, "Automaton", (PyObject *)&AutomatonType) < 0)
+    {
+        Py_DECREF(&AutomatonType);
+        Py_DECREF(module);
+        return NULL;
+    }
+    return module;
+}
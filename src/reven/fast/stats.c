@@ -0,0 +1,219 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <math.h>
+#include <object.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+
+/*
+ * Byte statistics computed in a single pass without holding the GIL.
+ */
+
+static PyObject *array_type = NULL;
+
+static PyObject *to_array(const char *typecode, const void *items, size_t size)
+{
+    PyObject *array = PyObject_CallFunction(array_type, "s", typecode);
+    if (!array || size == 0)
+    {
+        return array;
+    }
+    PyObject *view = PyMemoryView_FromMemory((char *)items, size, PyBUF_READ);
+    PyObject *result = view ? PyObject_CallMethod(array, "frombytes", "O", view) : NULL;
+    Py_XDECREF(view);
+    if (!result)
+    {
+        Py_DECREF(array);
+        return NULL;
+    }
+    Py_DECREF(result);
+    return array;
+}
+
+static void count_bytes(uint64_t counts[256], const unsigned char *data, size_t len)
+{
+    // separate tables avoid stalls on runs of the same byte value
+    uint64_t tables[4][256] = {{0}};
+    size_t i = 0;
+    for (; i + 4 <= len; i += 4)
+    {
+        tables[0][data[i]]++;
+        tables[1][data[i + 1]]++;
+        tables[2][data[i + 2]]++;
+        tables[3][data[i + 3]]++;
+    }
+    for (; i < len; i++)
+    {
+        tables[0][data[i]]++;
+    }
+    for (int v = 0; v < 256; v++)
+    {
+        counts[v] = tables[0][v] + tables[1][v] + tables[2][v] + tables[3][v];
+    }
+}
+
+static PyObject *histogram(PyObject *self, PyObject *args)
+{
+    Py_buffer buffer;
+    if (!PyArg_ParseTuple(args, "y*", &buffer))
+    {
+        return NULL;
+    }
+
+    uint64_t counts[256];
+    Py_BEGIN_ALLOW_THREADS;
+    count_bytes(counts, buffer.buf, buffer.len);
+    Py_END_ALLOW_THREADS;
+
+    PyBuffer_Release(&buffer);
+    return to_array("Q", counts, sizeof(counts));
+}
+
+/*
+ * Windowed statistics.
+ *
+ * The histogram of a window is updated incrementally as it slides, and so is
+ * the sum of c * log2(c) over its byte counts, from which the entropy of the
+ * window follows as log2(n) - sum / n. Windows which do not overlap are
+ * counted from scratch instead.
+ */
+
+typedef struct
+{
+    double *entropy;
+    double *zero;
+    double *ff;
+    double *printable;
+} WindowStats;
+
+static bool is_printable(unsigned char c)
+{
+    return (c >= 0x20 && c < 0x7f) || c == '\t' || c == '\n' || c == '\r';
+}
+
+static void window_stats_compute(WindowStats *out, const unsigned char *data, size_t window,
+                                 size_t stride, size_t num_windows, const double *clog2c)
+{
+    uint64_t counts[256] = {0};
+    size_t printable = 0;
+    double sum = 0;
+    size_t start = 0, end = 0; // the bytes currently counted
+
+    for (size_t w = 0; w < num_windows; w++)
+    {
+        size_t begin = w * stride;
+        if (begin >= end)
+        {
+            memset(counts, 0, sizeof(counts));
+            printable = 0;
+            sum = 0;
+            start = end = begin;
+        }
+        for (; start < begin; start++)
+        {
+            unsigned char c = data[start];
+            sum += clog2c[counts[c] - 1] - clog2c[counts[c]];
+            counts[c]--;
+            printable -= is_printable(c);
+        }
+        for (; end < begin + window; end++)
+        {
+            unsigned char c = data[end];
+            sum += clog2c[counts[c] + 1] - clog2c[counts[c]];
+            counts[c]++;
+            printable += is_printable(c);
+        }
+        double entropy = log2((double)window) - sum / window;
+        out->entropy[w] = entropy > 0 ? entropy : 0.0;
+        out->zero[w] = (double)counts[0x00] / window;
+        out->ff[w] = (double)counts[0xFF] / window;
+        out->printable[w] = (double)printable / window;
+    }
+}
+
+static PyObject *window_stats(PyObject *self, PyObject *args)
+{
+    Py_buffer buffer;
+    Py_ssize_t window, stride;
+    if (!PyArg_ParseTuple(args, "y*nn", &buffer, &window, &stride))
+    {
+        return NULL;
+    }
+    if (window <= 0 || stride <= 0)
+    {
+        PyBuffer_Release(&buffer);
+        PyErr_SetString(PyExc_ValueError, "window and stride must be positive");
+        return NULL;
+    }
+
+    // inputs shorter than a window are covered by a single shorter window
+    size_t len = buffer.len;
+    if ((size_t)window > len)
+    {
+        window = len;
+    }
+    size_t num_windows = window ? (len - window) / stride + 1 : 0;
+
+    PyObject *result = NULL;
+    double *clog2c = malloc((window + 1) * sizeof(double));
+    double *values = malloc((num_windows ? num_windows : 1) * 4 * sizeof(double));
+    if (!clog2c || !values)
+    {
+        PyErr_NoMemory();
+        goto done;
+    }
+    WindowStats out = {values, values + num_windows, values + 2 * num_windows,
+                       values + 3 * num_windows};
+
+    Py_BEGIN_ALLOW_THREADS;
+    clog2c[0] = 0;
+    for (Py_ssize_t c = 1; c <= window; c++)
+    {
+        clog2c[c] = c * log2((double)c);
+    }
+    window_stats_compute(&out, buffer.buf, window, stride, num_windows, clog2c);
+    Py_END_ALLOW_THREADS;
+
+    size_t size = num_windows * sizeof(double);
+    result = Py_BuildValue("(NNNN)", to_array("d", out.entropy, size),
+                           to_array("d", out.zero, size), to_array("d", out.ff, size),
+                           to_array("d", out.printable, size));
+
+done:
+    free(clog2c);
+    free(values);
+    PyBuffer_Release(&buffer);
+    return result;
+}
+
+static PyMethodDef module_methods[] = {
+    {"histogram", histogram, METH_VARARGS,
+     "Returns the number of occurrences of every byte value in the data."},
+    {"window_stats", window_stats, METH_VARARGS,
+     "Returns arrays of the entropy and the ratios of zero, 0xFF and printable bytes of "
+     "every window of the data, starting every stride bytes."},
+    {NULL, NULL, 0, NULL}};
+
+static struct PyModuleDef stats = {PyModuleDef_HEAD_INIT, "stats",
+                                   "Fast byte statistics in C", -1, module_methods};
+
+PyMODINIT_FUNC PyInit_stats()
+{
+    if (!array_type)
+    {
+        PyObject *array_module = PyImport_ImportModule("array");
+        if (!array_module)
+        {
+            return NULL;
+        }
+        array_type = PyObject_GetAttrString(array_module, "array");
+        Py_DECREF(array_module);
+        if (!array_type)
+        {
+            return NULL;
+        }
+    }
+    return PyModule_Create(&stats);
+}
@@ -0,0 +1,184 @@
+"""Decodes Intel HEX and Motorola S-record files, in which firmware is often
+distributed, to the binary images they describe."""
+
+from collections.abc import Iterable, Iterator
+from enum import Enum
+import binascii
+import io
+from typing import BinaryIO, Optional
+import unittest
+
+
+class HexFormat(str, Enum):
+    IHEX = "ihex"
+    SREC = "srec"
+
+
+# the number of address bytes of the data records S1, S2 and S3
+_SREC_ADDRESS_SIZES = {ord("1"): 2, ord("2"): 3, ord("3"): 4}
+
+
+def detect(head: bytes) -> Optional[HexFormat]:
+    """Returns the format of a file starting with head, or None if it is neither."""
+    head = head.lstrip()
+    if head[:1] == b":":
+        return HexFormat.IHEX
+    if head[:1] == b"S" and head[1:2].isdigit():
+        return HexFormat.SREC
+    return None
+
+
+def detect_file(file: BinaryIO) -> Optional[HexFormat]:
+    """Detects the format of a file without consuming what it reads."""
+    if hasattr(file, "peek"):
+        return detect(file.peek(64)[:64])
+    head = file.read(64)
+    file.seek(-len(head), io.SEEK_CUR)
+    return detect(head)
+
+
+def _record(line: bytes, number: int) -> bytes:
+    try:
+        record = binascii.a2b_hex(line)
+    except binascii.Error:
+        raise ValueError(f"line {number}: invalid hex digits")
+    if not record:
+        raise ValueError(f"line {number}: empty record")
+    return record
+
+
+def _ihex_segments(lines: Iterable[bytes]) -> Iterator[tuple[int, bytes]]:
+    base = 0
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[:1] != b":":
+            raise ValueError(f"line {number}: expected a record starting with :")
+        record = _record(line[1:], number)
+        if len(record) < 5 or len(record) != record[0] + 5:
+            raise ValueError(f"line {number}: invalid record length")
+        if sum(record) & 0xFF:
+            raise ValueError(f"line {number}: invalid checksum")
+
+        address = int.from_bytes(record[1:3])
+        data = record[4:-1]
+        match record[3]:
+            case 0x00:
+                yield base + address, data
+            case 0x01:
+                return
+            case 0x02:
+                # extended segment address, in units of 16 bytes
+                base = int.from_bytes(data) << 4
+            case 0x04:
+                # extended linear address, the upper 16 bits of addresses
+                base = int.from_bytes(data) << 16
+            case 0x03 | 0x05:
+                # start addresses do not affect the image
+                pass
+            case kind:
+                raise ValueError(f"line {number}: unknown record type {kind:02x}")
+
+
+def _srec_segments(lines: Iterable[bytes]) -> Iterator[tuple[int, bytes]]:
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line[:1] != b"S" or len(line) < 2:
+            raise ValueError(f"line {number}: expected a record starting with S")
+        record = _record(line[2:], number)
+        if len(record) != record[0] + 1:
+            raise ValueError(f"line {number}: invalid record length")
+        if sum(record) & 0xFF != 0xFF:
+            raise ValueError(f"line {number}: invalid checksum")
+
+        address_size = _SREC_ADDRESS_SIZES.get(line[1])
+        if address_size is not None:
+            address = int.from_bytes(record[1 : 1 + address_size])
+            yield address, record[1 + address_size : -1]
+        elif line[1] in b"789":
+            # the termination records of S3, S2 and S1 records
+            return
+        elif line[1] not in b"0456":
+            raise ValueError(f"line {number}: unknown record type S{chr(line[1])}")
+
+
+def segments(lines: Iterable[bytes], format: HexFormat) -> Iterator[tuple[int, bytes]]:
+    """Parses the lines of a file one at a time and yields the address and data of
+    every data record. Extended address records are applied to the addresses."""
+    match format:
+        case HexFormat.IHEX:
+            return _ihex_segments(lines)
+        case HexFormat.SREC:
+            return _srec_segments(lines)
+
+
+def to_binary(segments: Iterable[tuple[int, bytes]], fill: int = 0) -> bytearray:
+    """Returns the image spanning from the lowest to the highest address of segments,
+    where gaps between segments are filled with fill, as by objcopy -O binary."""
+    # segments are collected first, so that records in descending order do not prepend
+    # to the image over and over
+    segments = list(segments)
+    if not segments:
+        return bytearray()
+    start = min(address for address, _ in segments)
+    end = max(address + len(data) for address, data in segments)
+    image = bytearray([fill]) * (end - start)
+    for address, data in segments:
+        image[address - start : address - start + len(data)] = data
+    return image
+
+
+def decode(file: BinaryIO, format: HexFormat, fill: int = 0) -> bytearray:
+    return to_binary(segments(file, format), fill)
+
+
+class HexFileTests(unittest.TestCase):
+    IHEX = b"""\
+:020000040001F9
+:0400000001020304F2
+:02000800AABB91
+:00000001FF
+"""
+    SREC = b"""\
+S00600004844521B
+S107000001020304EE
+S1050008AABB8D
+S9030000FC
+"""
+
+    def test_detect(self):
+        self.assertEqual(detect(self.IHEX), HexFormat.IHEX)
+        self.assertEqual(detect(self.SREC), HexFormat.SREC)
+        self.assertIsNone(detect(b"\x7fELF"))
+
+    def test_ihex(self):
+        lines = self.IHEX.splitlines()
+        self.assertEqual(
+            list(segments(lines, HexFormat.IHEX)),
+            [(0x10000, b"\x01\x02\x03\x04"), (0x10008, b"\xaa\xbb")],
+        )
+        self.assertEqual(
+            to_binary(segments(lines, HexFormat.IHEX), 0xFF),
+            b"\x01\x02\x03\x04\xff\xff\xff\xff\xaa\xbb",
+        )
+
+    def test_srec(self):
+        self.assertEqual(
+            to_binary(segments(self.SREC.splitlines(), HexFormat.SREC)),
+            b"\x01\x02\x03\x04\x00\x00\x00\x00\xaa\xbb",
+        )
+
+    def test_unordered(self):
+        self.assertEqual(to_binary([(4, b"\x02"), (2, b"\x01")]), b"\x01\x00\x02")
+        self.assertEqual(
+            to_binary([(3, b"\x03\x04"), (0, b"\x01\x02\x05")], 0xFF),
+            b"\x01\x02\x05\x03\x04",
+        )
+        self.assertEqual(to_binary([]), b"")
+
+    def test_checksum(self):
+        with self.assertRaisesRegex(ValueError, "line 2: invalid checksum"):
+            list(segments([b"", b":0400000001020304F3"], HexFormat.IHEX))
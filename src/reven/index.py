@@ -0,0 +1,256 @@
+from __future__ import annotations
+import json
+import os
+import tempfile
+import unittest
+from collections.abc import Iterable, Iterator, Sequence
+from pathlib import Path
+from typing import Optional
+import numpy as np
+from reven.lib import map_input, process_inputs
+
+INDEX_VERSION = 1
+NGRAM_SIZE = 3
+NUM_TRIGRAMS = 1 << 24
+# files with more distinct trigrams, e.g. compressed data, would match almost every
+# query, so they are always searched instead of being indexed
+MAX_TRIGRAMS = 1 << 20
+# the number of postings sorted in memory at once while building an index
+RUN_SIZE = 1 << 26
+_CHUNK_SIZE = 1 << 24
+
+
+def _pack(buf: np.ndarray) -> np.ndarray:
+    buf = buf.astype(np.uint32)
+    return buf[:-2] << 16 | buf[1:-1] << 8 | buf[2:]
+
+
+def file_trigrams(input: str) -> np.ndarray:
+    """Returns the sorted distinct trigrams of a file, each packed into an integer."""
+    with map_input(input) as data:
+        buf = np.frombuffer(data, dtype=np.uint8)
+        if len(buf) < NGRAM_SIZE:
+            return np.empty(0, dtype=np.uint32)
+
+        seen = np.zeros(NUM_TRIGRAMS, dtype=bool) if len(buf) > _CHUNK_SIZE else None
+        for start in range(0, len(buf) - NGRAM_SIZE + 1, _CHUNK_SIZE):
+            keys = _pack(buf[start : start + _CHUNK_SIZE + NGRAM_SIZE - 1])
+            if seen is None:
+                trigrams = np.unique(keys)
+            else:
+                seen[keys] = True
+        # the mapping cannot be closed while arrays refer to it
+        del buf
+
+    if seen is not None:
+        trigrams = np.flatnonzero(seen).astype(np.uint32)
+    return trigrams
+
+
+def query_trigrams(segments: Iterable[bytes]) -> np.ndarray:
+    """Returns the distinct trigrams of the fixed segments of a query."""
+    keys = [
+        _pack(np.frombuffer(segment, dtype=np.uint8))
+        for segment in segments
+        if len(segment) >= NGRAM_SIZE
+    ]
+    return np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.uint32)
+
+
+def walk_files(paths: Iterable[Path], exclude: Optional[Path] = None) -> Iterator[str]:
+    """Yields the real paths of the regular files below paths in a stable order."""
+    exclude = exclude.resolve() if exclude is not None else None
+    for path in paths:
+        path = path.resolve()
+        if path.is_file():
+            yield str(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if Path(root, d) != exclude)
+            for name in sorted(files):
+                file = os.path.join(root, name)
+                if os.path.isfile(file) and not os.path.islink(file):
+                    yield file
+
+
+class NgramIndex:
+    """An inverted index from the trigrams of a corpus to the files containing them,
+    used to skip files which cannot contain a match. Posting lists are memory mapped,
+    so a query only reads the lists of its own trigrams.
+
+    Files changed since the index was built are always searched."""
+
+    def __init__(self, path: Path):
+        with open(path / "files.json") as file:
+            meta = json.load(file)
+        if meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"{path} is not a compatible index, rebuild it")
+        self.path = path
+        self.paths: list[str] = meta["paths"]
+        self.sizes: list[int] = meta["sizes"]
+        self.mtimes: list[int] = meta["mtimes"]
+        self.unindexed: list[int] = meta["unindexed"]
+        self.trigrams = np.load(path / "trigrams.npy", mmap_mode="r")
+        self.offsets = np.load(path / "offsets.npy", mmap_mode="r")
+        self.postings = np.load(path / "postings.npy", mmap_mode="r")
+        self._ids = {path: i for i, path in enumerate(self.paths)}
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    def __contains__(self, path: str) -> bool:
+        return os.path.realpath(path) in self._ids
+
+    def _postings(self, trigram: int) -> np.ndarray:
+        i = np.searchsorted(self.trigrams, trigram)
+        if i == len(self.trigrams) or self.trigrams[i] != trigram:
+            return np.empty(0, dtype=np.uint32)
+        return self.postings[self.offsets[i] : self.offsets[i + 1]]
+
+    def _query(self, trigrams: np.ndarray) -> np.ndarray:
+        postings = sorted(map(self._postings, trigrams), key=len)
+        ids = postings[0]
+        for other in postings[1:]:
+            if len(ids) == 0:
+                break
+            ids = np.intersect1d(ids, other, assume_unique=True)
+        return ids
+
+    def candidates(self, queries: Iterable[Sequence[bytes]]) -> list[str]:
+        """Returns the existing files which may match any of the queries, each given by
+        the segments of bytes it matches exactly."""
+        matched = np.zeros(len(self.paths), dtype=bool)
+        matched[self.unindexed] = True
+        for segments in queries:
+            trigrams = query_trigrams(segments)
+            if len(trigrams) == 0:
+                matched[:] = True
+                break
+            matched[self._query(trigrams)] = True
+
+        candidates = []
+        for i, path in enumerate(self.paths):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            stale = stat.st_size != self.sizes[i] or stat.st_mtime_ns != self.mtimes[i]
+            if matched[i] or stale:
+                candidates.append(path)
+        return candidates
+
+    @staticmethod
+    def build(
+        path: Path,
+        files: Sequence[str],
+        jobs: int = 1,
+        max_trigrams: int = MAX_TRIGRAMS,
+        run_size: int = RUN_SIZE,
+    ) -> "NgramIndex":
+        """Indexes files into the directory at path.
+
+        Postings are sorted in runs of bounded size which are spilled to disk, then the
+        runs are written into their final positions in the memory mapped posting list.
+        """
+        path.mkdir(parents=True, exist_ok=True)
+        stats = [os.stat(file) for file in files]
+        counts = np.zeros(NUM_TRIGRAMS, dtype=np.uint64)
+        unindexed = []
+
+        with tempfile.TemporaryDirectory(dir=path) as tmp:
+            runs: list[Path] = []
+            batch: list[tuple[int, np.ndarray]] = []
+            batch_size = 0
+
+            def flush():
+                keys = np.concatenate([trigrams for _, trigrams in batch])
+                ids = np.repeat(
+                    np.array([id for id, _ in batch], dtype=np.uint32),
+                    [len(trigrams) for _, trigrams in batch],
+                )
+                order = np.argsort(keys, kind="stable")
+                run = Path(tmp, f"{len(runs)}.npz")
+                np.savez(run, keys=keys[order], ids=ids[order])
+                counts[:] += np.bincount(keys, minlength=NUM_TRIGRAMS).astype(np.uint64)
+                runs.append(run)
+                batch.clear()
+
+            for id, trigrams in enumerate(process_inputs(file_trigrams, files, jobs)):
+                if len(trigrams) > max_trigrams:
+                    unindexed.append(id)
+                    continue
+                batch.append((id, trigrams))
+                batch_size += len(trigrams)
+                if batch_size >= run_size:
+                    flush()
+                    batch_size = 0
+            if batch:
+                flush()
+
+            trigrams = np.flatnonzero(counts).astype(np.uint32)
+            offsets = np.zeros(len(trigrams) + 1, dtype=np.uint64)
+            np.cumsum(counts[trigrams], out=offsets[1:])
+            postings = np.lib.format.open_memmap(
+                path / "postings.npy", "w+", np.uint32, (int(offsets[-1]),)
+            )
+            # the next free position of every trigram, runs are in order of file ids
+            cursor = np.zeros(NUM_TRIGRAMS, dtype=np.uint64)
+            cursor[trigrams] = offsets[:-1]
+            for run in runs:
+                with np.load(run) as arrays:
+                    keys, ids = arrays["keys"], arrays["ids"]
+                first = np.searchsorted(keys, keys).astype(np.uint64)
+                rank = np.arange(len(keys), dtype=np.uint64) - first
+                postings[cursor[keys] + rank] = ids
+                cursor[:] += np.bincount(keys, minlength=NUM_TRIGRAMS).astype(np.uint64)
+            postings.flush()
+            del postings
+
+        np.save(path / "trigrams.npy", trigrams)
+        np.save(path / "offsets.npy", offsets)
+        with open(path / "files.json", "w") as file:
+            json.dump(
+                {
+                    "version": INDEX_VERSION,
+                    "ngram_size": NGRAM_SIZE,
+                    "paths": list(files),
+                    "sizes": [stat.st_size for stat in stats],
+                    "mtimes": [stat.st_mtime_ns for stat in stats],
+                    "unindexed": unindexed,
+                },
+                file,
+            )
+        return NgramIndex(path)
+
+
+class NgramIndexTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        root = Path(self.dir.name)
+        (root / "corpus").mkdir()
+        contents = [b"\x00\x01\x02\x03hello", b"\x01\x02\x03world", b"hello world", b""]
+        for i, content in enumerate(contents):
+            (root / "corpus" / f"{i}.bin").write_bytes(content)
+        self.files = list(walk_files([root / "corpus"]))
+        # a small run size spills every file to its own run
+        self.index = NgramIndex.build(root / "index", self.files, run_size=1)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_candidates(self):
+        names = lambda paths: [Path(path).name for path in paths]
+        self.assertEqual(["0.bin", "2.bin"], names(self.index.candidates([[b"hello"]])))
+        self.assertEqual(
+            ["0.bin", "1.bin"], names(self.index.candidates([[b"\x01\x02\x03"]]))
+        )
+        self.assertEqual(
+            ["1.bin", "2.bin"], names(self.index.candidates([[b"wor", b"rld"]]))
+        )
+        self.assertEqual([], names(self.index.candidates([[b"absent"]])))
+        # queries without trigrams match every file
+        self.assertEqual(4, len(self.index.candidates([[b"he"]])))
+
+    def test_stale(self):
+        Path(self.files[3]).write_bytes(b"now hello")
+        self.assertIn(self.files[3], self.index.candidates([[b"absent"]]))
@@ -1,10 +1,18 @@
 from __future__ import annotations
-from collections.abc import Iterable
+from array import array
+from collections.abc import Iterable, Iterator, Sequence, Sized
+import base64
+import collections
+import contextlib
 from enum import Enum
-import importlib
+import functools
 import io
+import itertools
+import json
+import math
+import mmap
 import os
-import pkgutil
+import time
 from typing import (
     Annotated,
     Any,
@@ -16,23 +24,69 @@ from typing import (
     BinaryIO,
     Literal,
     Type,
+    TYPE_CHECKING,
     get_args,
     get_origin,
     get_type_hints,
     runtime_checkable,
 )
+import struct
+import sys
 import unittest
+import attr
 import cattr
 import typer
 import yaml
+
+# imported where they are used, since every command imports this module
+if TYPE_CHECKING:
+    import numpy as np
+    from reven import cache
 from rich.table import Table
 from rich import print
 from rich.markup import escape
+from rich.console import Console
+from rich.progress import track
 
 
 class InputFormat(str, Enum):
     FILE_LIST = "file_list"
     YAML = "yaml"
+    BINARY = "binary"
+
+
+class OutputFormat(str, Enum):
+    YAML = "yaml"
+    JSONL = "jsonl"
+    BINARY = "binary"
+
+
+# set by --format
+output_format = OutputFormat.YAML
+
+
+class InputDecoding(str, Enum):
+    AUTO = "auto"
+    IHEX = "ihex"
+    SREC = "srec"
+
+
+# set by --decode
+input_decoding: Optional[InputDecoding] = None
+
+# the C implementations of libyaml are much faster, but are not always available
+YamlDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+YamlLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+converter = cattr.Converter()
+# positions are kept as compact arrays until they are written
+converter.register_unstructure_hook(array, array.tolist)
+# bytes are written to JSON Lines in base64, and read from binary records as views
+converter.register_structure_hook(
+    bytes,
+    lambda value, _: base64.b64decode(value) if isinstance(value, str) else value,
+)
 
 
 class TabularColumn:
@@ -51,12 +105,41 @@ class TabularColumn:
         self.highlight = highlight
 
 
-def _to_table[T: Tabular](cls: Type[T], obj: T):
-    annotations = cls.__annotations__
+# set by --limit and --sort
+table_limit: Optional[int] = None
+table_sort: Optional[str] = None
+# tables on terminals are truncated to this many rows unless --limit is given
+DEFAULT_TABLE_LIMIT = 1000
+# cells listing more values, such as the positions of matches, are summarized
+MAX_CELL_VALUES = 64
+
+
+def summarize_values[V](
+    values: Sequence[V], format: Callable[[V], str], separator: str = " "
+) -> str:
+    """Joins the formatted values, or the first MAX_CELL_VALUES of them followed by the
+    number of values left out."""
+    if len(values) <= MAX_CELL_VALUES:
+        return separator.join(map(format, values))
+    shown = separator.join(map(format, values[:MAX_CELL_VALUES]))
+    return f"{shown}{separator}… ({len(values) - MAX_CELL_VALUES} more)"
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class _Column:
+    key: str
+    column: TabularColumn
+    # the class of the items of columns holding lists of Tabular, shown as tables
+    nested: Optional[type]
+
+
+@functools.cache
+def _columns(cls: type) -> list[_Column]:
+    """Returns the columns of a Tabular class, which are resolved once per class."""
+    annotations = get_type_hints(cls, include_extras=True)
     type_hints = get_type_hints(cls)
 
-    # retrieve columns
-    columns = dict()
+    columns = []
     for key, typ in annotations.items():
         col = None
         if get_origin(typ) == Annotated:
@@ -65,36 +148,39 @@ def _to_table[T: Tabular](cls: Type[T], obj: T):
                     col = arg
         if col is None:
             col = TabularColumn()
-        columns[key] = col
 
-    # create table
+        key_class = type_hints[key]
+        key_class_origin = get_origin(key_class)
+        key_class_args = get_args(key_class)
+        nested = None
+        if (
+            key_class_origin is not None
+            and len(key_class_args) > 0
+            and issubclass(key_class_origin, Iterable)
+            and isinstance(key_class_args[0], type)
+            and issubclass(key_class_args[0], Tabular)
+        ):
+            nested = key_class_args[0]
+        columns.append(_Column(key, col, nested))
+    return columns
+
+
+def _to_table[T: Tabular](cls: Type[T], obj: Iterable[T]):
+    columns = [col for col in _columns(cls) if not col.column.hidden]
     table = Table(
-        *(
-            col.name or key.replace("_", " ").title()
-            for key, col in columns.items()
-            if not col.hidden
-        )
+        *(col.column.name or col.key.replace("_", " ").title() for col in columns)
     )
 
     for item in obj:
         values = []
-        for key, col in columns.items():
-            if col.hidden:
-                continue
-            value = getattr(item, key)
-            key_class = type_hints[key]
-            key_class_origin = get_origin(key_class)
-            key_class_args = get_args(key_class)
-
+        for column in columns:
+            col = column.column
+            value = getattr(item, column.key)
             if col.serialize:
-                values.append(yaml.safe_dump(cattr.Converter().unstructure(value)))
-            elif (
-                key_class_origin is not None
-                and len(key_class_args) > 0
-                and issubclass(key_class_origin, Iterable)
-                and issubclass(key_class_args[0], Tabular)
-            ):
-                values.append(_to_table(key_class_args[0], value))
+                unstructured = converter.unstructure(value)
+                values.append(yaml.dump(unstructured, Dumper=YamlDumper))
+            elif column.nested is not None:
+                values.append(_to_table(column.nested, value))
             else:
                 highlight = col.highlight(item, value) if col.highlight else None
                 if col.format:
@@ -110,35 +196,187 @@ def _to_table[T: Tabular](cls: Type[T], obj: T):
     return table
 
 
+def _sort_key(value: Any) -> Any:
+    # lists such as positions are sorted by their length
+    if isinstance(value, (str, bytes)) or not isinstance(value, Sized):
+        return value
+    return len(value)
+
+
+def _sorted[T: Tabular](cls: Type[T], obj: Iterable[T], sort: str) -> list[T]:
+    """Sorts by the attribute named by sort, in descending order if it starts with -."""
+    key = sort.removeprefix("-")
+    if key not in {col.key for col in _columns(cls)}:
+        keys = ", ".join(col.key for col in _columns(cls))
+        raise typer.BadParameter(f"{key} is not one of {keys}", param_hint="--sort")
+    return sorted(
+        obj,
+        key=lambda item: _sort_key(getattr(item, key)),
+        reverse=sort.startswith("-"),
+    )
+
+
 @runtime_checkable
 class Tabular(Protocol):
     @classmethod
-    def tabular_write(cls: Type[Self], file: TextIO, obj: list[Self]):
-        if len(obj) == 0:
-            if not is_tty(file):
-                yaml.safe_dump([], file)
+    def tabular_write(cls: Type[Self], file: TextIO, obj: Iterable[Self]):
+        """Prints a table to terminals, otherwise writes each item as soon as it is
+        produced. Items are sorted by --sort and limited to --limit, and tables on
+        terminals are truncated to DEFAULT_TABLE_LIMIT rows by default."""
+        if table_sort:
+            obj = _sorted(cls, obj, table_sort)
+        if not is_tty(file):
+            if table_limit:
+                obj = itertools.islice(obj, table_limit)
+            write_records(file, _unstructure(obj))
             return
 
-        annotations = cls.__annotations__
-
-        # retrieve columns
-        columns = dict()
-        for key, type in annotations.items():
-            col = None
-            if get_origin(type) == Annotated:
-                for arg in get_args(type):
-                    if isinstance(arg, TabularColumn):
-                        col = arg
-            if col is None:
-                col = TabularColumn()
-            columns[key] = col
-
-        # write columns to file
-        if is_tty(file):
-            print(_to_table(cls, obj), file=file)
-        else:
-            unstructured = cattr.Converter().unstructure(obj)
-            yaml.safe_dump(unstructured, file)
+        limit = DEFAULT_TABLE_LIMIT if table_limit is None else table_limit
+        # one more row tells whether the table is truncated, without producing the rest
+        rows = list(itertools.islice(obj, limit + 1) if limit else obj)
+        if not rows:
+            return
+        with stage("render"):
+            table = _to_table(cls, rows[:limit] if limit else rows)
+            if limit and len(rows) > limit:
+                table.caption = f"Showing the first {limit} rows. Use --limit to \
+show more, or --limit 0 to show all."
+            print(table, file=file)
+
+
+def _unstructure(obj: Iterable[Any]) -> Iterator[Any]:
+    for item in obj:
+        with stage("unstructure"):
+            record = converter.unstructure(item)
+        yield record
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (bytes, bytearray)):
+        # as in the !!binary tag of YAML
+        return base64.b64encode(value).decode()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+# Binary records start with BINARY_MAGIC, followed by one frame per record. A frame
+# is the size of its JSON header and of its body, the header, and the body, which
+# holds the bytes values of the record. They are referenced from the header by
+# {"$binary": [offset, size]} and written and read without encoding.
+BINARY_MAGIC = b"\xffREVEN\x01\n"
+_FRAME_HEADER = struct.Struct("<IQ")
+
+
+def _write_frame(buffer: BinaryIO, value: Any):
+    payloads = []
+    size = 0
+
+    def default(value: Any) -> Any:
+        nonlocal size
+        if isinstance(value, (bytes, bytearray, memoryview, mmap.mmap)):
+            payload = memoryview(value).cast("B")
+            payloads.append(payload)
+            size += len(payload)
+            return {"$binary": [size - len(payload), len(payload)]}
+        raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+    header = json.dumps(value, default=default).encode()
+    buffer.write(_FRAME_HEADER.pack(len(header), size))
+    buffer.write(header)
+    for payload in payloads:
+        buffer.write(payload)
+
+
+def _read_frames(buffer: BinaryIO) -> Iterator[Any]:
+    if buffer.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError("not a stream of binary records")
+    while prefix := buffer.read(_FRAME_HEADER.size):
+        if len(prefix) != _FRAME_HEADER.size:
+            raise ValueError("truncated binary record")
+        header_size, body_size = _FRAME_HEADER.unpack(prefix)
+        header = buffer.read(header_size)
+        # bytes values are views of the body of the frame, which is read in one piece
+        body = bytearray(body_size)
+        if len(header) != header_size or buffer.readinto(body) != body_size:
+            raise ValueError("truncated binary record")
+        view = memoryview(body)
+
+        def object_hook(obj: dict) -> Any:
+            if obj.keys() == {"$binary"}:
+                offset, size = obj["$binary"]
+                return view[offset : offset + size]
+            return obj
+
+        yield json.loads(header, object_hook=object_hook)
+
+
+def _binary_output(file: TextIO) -> BinaryIO:
+    # text already written must precede the binary data
+    file.flush()
+    return file.buffer
+
+
+def write_value(file: TextIO, value: Any):
+    """Writes a single unstructured value in the output format."""
+    with stage("serialize"):
+        match output_format:
+            case OutputFormat.YAML:
+                yaml.dump(value, file, Dumper=YamlDumper)
+            case OutputFormat.JSONL:
+                file.write(json.dumps(value, default=_json_default) + "\n")
+            case OutputFormat.BINARY:
+                buffer = _binary_output(file)
+                buffer.write(BINARY_MAGIC)
+                _write_frame(buffer, value)
+                buffer.flush()
+
+
+def write_records(file: TextIO, records: Iterable[Any]):
+    """Writes unstructured records one at a time in the output format, as a YAML
+    sequence, as JSON Lines or as binary frames, so that readers can consume them while
+    they are produced."""
+    match output_format:
+        case OutputFormat.YAML:
+            empty = True
+            for record in records:
+                with stage("serialize"):
+                    yaml.dump([record], file, Dumper=YamlDumper)
+                empty = False
+            if empty:
+                yaml.dump([], file, Dumper=YamlDumper)
+        case OutputFormat.JSONL:
+            for record in records:
+                with stage("serialize"):
+                    file.write(json.dumps(record, default=_json_default) + "\n")
+        case OutputFormat.BINARY:
+            buffer = _binary_output(file)
+            buffer.write(BINARY_MAGIC)
+            for record in records:
+                with stage("serialize"):
+                    _write_frame(buffer, record)
+            buffer.flush()
+
+
+def read_records(file: TextIO) -> Iterator[Any]:
+    """Reads records written by write_records in any format. JSON Lines and binary
+    records are read one at a time, while YAML documents are parsed as a whole."""
+    buffer = getattr(file, "buffer", None)
+    if buffer is not None and hasattr(buffer, "peek"):
+        if buffer.peek(len(BINARY_MAGIC)).startswith(BINARY_MAGIC):
+            yield from _read_frames(buffer)
+            return
+
+    first = file.readline()
+    if first.lstrip().startswith("{"):
+        lines = itertools.chain([first], file)
+        for line in lines:
+            if line.strip():
+                with stage("parse"):
+                    record = json.loads(line)
+                yield record
+    else:
+        with stage("parse"):
+            records = yaml.load(first + file.read(), Loader=YamlLoader) or []
+        yield from records
 
 
 def exec_command(
@@ -168,52 +406,580 @@ def is_tty(f: io.TextIOBase | io.RawIOBase | io.BufferedIOBase) -> bool:
     return os.isatty(fd)
 
 
-def load_plugin_apps() -> list[typer.Typer]:
-    return {
-        getattr(importlib.import_module(name), "app")
-        for _, name, _ in pkgutil.iter_modules()
-        if name.startswith("reven_plugin_")
-    }
+class Stats:
+    """Wall and CPU time spent in the stages of a command, and counters such as the
+    number of bytes read, reported by --stats. Stages nest, and the time of a nested
+    stage is not counted in the enclosing one."""
+
+    def __init__(self):
+        self.wall: dict[str, float] = collections.defaultdict(float)
+        self.cpu: dict[str, float] = collections.defaultdict(float)
+        self.counters: dict[str, int] = collections.defaultdict(int)
+        self.start = (time.perf_counter(), time.process_time())
+        self._last = self.start
+        self._children = self._children_cpu()
+        self._stages: list[str] = []
+
+    def _switch(self):
+        now = (time.perf_counter(), time.process_time())
+        if self._stages:
+            self.wall[self._stages[-1]] += now[0] - self._last[0]
+            self.cpu[self._stages[-1]] += now[1] - self._last[1]
+        self._last = now
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        self._switch()
+        self._stages.append(name)
+        try:
+            yield
+        finally:
+            self._switch()
+            self._stages.pop()
+
+    @staticmethod
+    def _rusage(who: str) -> Optional[Any]:
+        # resource is only available on Unix
+        try:
+            import resource
+        except ImportError:
+            return None
+        return resource.getrusage(getattr(resource, who))
+
+    @classmethod
+    def _children_cpu(cls) -> Optional[float]:
+        children = cls._rusage("RUSAGE_CHILDREN")
+        return None if children is None else children.ru_utime + children.ru_stime
+
+    def report(self) -> dict[str, Any]:
+        wall = time.perf_counter() - self.start[0]
+        cpu = time.process_time() - self.start[1]
+        stages = {
+            name: {"wall": self.wall[name], "cpu": self.cpu[name]} for name in self.wall
+        }
+        stages["other"] = {
+            "wall": wall - sum(self.wall.values()),
+            "cpu": cpu - sum(self.cpu.values()),
+        }
+        usage = self._rusage("RUSAGE_SELF")
+        children = self._rusage("RUSAGE_CHILDREN")
+        peak_rss = None
+        if usage is not None:
+            # in kibibytes on Linux, but in bytes on macOS
+            peak_rss = max(usage.ru_maxrss, children.ru_maxrss) * (
+                1 if sys.platform == "darwin" else 1024
+            )
+        children_cpu = self._children_cpu()
+        return {
+            "stages": stages,
+            "wall": wall,
+            "cpu": cpu,
+            # time of worker processes started by --jobs
+            "cpu_children": (
+                None if children_cpu is None else children_cpu - self._children
+            ),
+            "mb_per_s": self.counters["bytes"] / wall / 1e6,
+            "files_per_s": self.counters["files"] / wall,
+            "peak_rss": peak_rss,
+            **self.counters,
+        }
+
+
+def _format_seconds(_, seconds: float) -> str:
+    return f"{seconds:.3f}"
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class StageStats(Tabular):
+    stage: str
+    wall: Annotated[float, TabularColumn(name="Wall (s)", format=_format_seconds)]
+    cpu: Annotated[float, TabularColumn(name="CPU (s)", format=_format_seconds)]
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class StatsValue(Tabular):
+    name: str
+    value: str
+
+
+def _format_stat(value: Any) -> str:
+    if value is None:
+        return "unavailable"
+    return f"{value:.3f}" if isinstance(value, float) else str(value)
+
+
+def print_stats(report: dict[str, Any], file: TextIO):
+    """Prints the report of Stats as tables."""
+    stages = [StageStats(name, **times) for name, times in report["stages"].items()]
+    values = [
+        StatsValue(name, _format_stat(value))
+        for name, value in report.items()
+        if name != "stages"
+    ]
+    console = Console(file=file)
+    console.print(_to_table(StageStats, stages))
+    console.print(_to_table(StatsValue, values))
+
+
+# set by --stats
+stats: Optional[Stats] = None
+_NO_STAGE = contextlib.nullcontext()
+
+
+def stage(name: str) -> contextlib.AbstractContextManager:
+    """Attributes the time spent in the block to a stage of the command, such as open,
+    scan or serialize, if --stats is enabled. Plugins can report their stages too."""
+    return _NO_STAGE if stats is None else stats.stage(name)
+
+
+def increment(name: str, value: int = 1):
+    """Adds to a counter reported by --stats, such as bytes, files or matches."""
+    if stats is not None:
+        stats.counters[name] += value
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class MappedInput:
+    """An input which is already mapped into memory, such as by the cache after hashing
+    it, so that it is scanned from the same mapping instead of being mapped again."""
+
+    name: str
+    data: mmap.mmap | bytes
+
+
+def input_name(input: BinaryIO | MappedInput | str) -> Optional[str]:
+    """Returns the name of an input given by name or opened."""
+    return input if isinstance(input, str) else getattr(input, "name", None)
+
+
+@contextlib.contextmanager
+def open_input(
+    input: BinaryIO | MappedInput | str, decode: bool = True
+) -> Iterator[BinaryIO]:
+    """Opens an input given by name, or passes an already opened input through. Inputs
+    are decoded as set by --decode, unless decode is False."""
+    if isinstance(input, str):
+        with stage("open"):
+            file = open(input, "rb")
+        with file:
+            yield _decode_input(file) if decode else file
+    elif isinstance(input, MappedInput):
+        # mappings are read in place, but decoding iterates over lines, which mmap
+        # does not support
+        if isinstance(input.data, mmap.mmap) and not (decode and input_decoding):
+            yield input.data
+        else:
+            file = io.BytesIO(input.data)
+            yield _decode_input(file, input.name) if decode else file
+    else:
+        yield _decode_input(input) if decode else input
+
+
+def _decode_input(file: BinaryIO, name: Optional[str] = None) -> BinaryIO:
+    if input_decoding is None:
+        return file
+    from reven import hexfile
+
+    with stage("decode"):
+        if input_decoding == InputDecoding.AUTO:
+            # files in neither format are passed through
+            format = hexfile.detect_file(file)
+            if format is None:
+                return file
+        else:
+            format = hexfile.HexFormat(input_decoding.value)
+        try:
+            return io.BytesIO(hexfile.decode(file, format))
+        except ValueError as e:
+            name = name or getattr(file, "name", "input")
+            raise ValueError(f"{name}: {e}") from None
+
+
+@contextlib.contextmanager
+def map_input(
+    input: BinaryIO | MappedInput | str, decode: bool = True
+) -> Iterator[mmap.mmap | bytes]:
+    """Maps an input into memory without copying it. Inputs that cannot be mapped,
+    such as pipes and empty files, are read instead."""
+    if isinstance(input, MappedInput) and not (decode and input_decoding):
+        yield input.data
+        return
+    with open_input(input, decode) as file:
+        with stage("open"):
+            try:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError, io.UnsupportedOperation):
+                data = None
+
+        if data is None:
+            with stage("read"):
+                buffer = file.read()
+            yield buffer
+        else:
+            with data:
+                yield data
+
+
+def process_inputs[R](
+    fn: Callable[[BinaryIO | str], R],
+    inputs: Sequence[BinaryIO | str],
+    jobs: int = 1,
+    progress: bool = False,
+    cache_key: Optional[str] = None,
+) -> Iterator[R]:
+    """Applies fn to every input and yields the results in input order. With more than
+    one job the inputs are processed by a pool of worker processes, which are passed
+    file names since open files cannot be shared between processes.
+
+    With a cache_key describing fn and its parameters, results are cached by the content
+    of the inputs, and inputs with identical content are only processed once."""
+    from reven import cache
+
+    names = [input_name(input) for input in inputs]
+    are_files = all(isinstance(name, str) and os.path.isfile(name) for name in names)
+    if cache_key is not None and input_decoding is not None:
+        cache_key += f":decode={input_decoding.value}"
+    result_cache = cache.open_cache() if cache_key is not None and are_files else None
+
+    if result_cache is None:
+        results = _map_inputs(fn, inputs, names if are_files else None, jobs)
+    else:
+        results = _map_cached(fn, inputs, names, jobs, result_cache, cache_key)
+
+    if stats is not None:
+        results = _count_inputs(results, inputs)
+    if progress:
+        results = track(
+            results,
+            total=len(inputs),
+            console=Console(file=sys.stderr),
+            description="",
+        )
+    yield from results
+
+
+def _count_inputs[R](results: Iterator[R], inputs: Sequence[BinaryIO | str]):
+    for result, input in zip(results, inputs):
+        increment("files")
+        try:
+            increment(
+                "bytes",
+                os.path.getsize(input)
+                if isinstance(input, str)
+                else os.fstat(input.fileno()).st_size,
+            )
+        except (OSError, ValueError, io.UnsupportedOperation):
+            pass
+        yield result
+
+
+def _map_inputs[R](
+    fn: Callable[[BinaryIO | str], R],
+    inputs: Sequence[BinaryIO],
+    names: Optional[list[str]],
+    jobs: int,
+) -> Iterator[R]:
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    jobs = min(jobs, len(inputs))
+    if names is None:
+        # streams such as stdin can only be read by this process
+        jobs = 1
+
+    # reading mapped inputs is part of the scan, and with more than one job the scan is
+    # the time spent waiting for the workers
+    if jobs > 1:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(
+            jobs, initializer=_init_worker, initargs=(input_decoding,)
+        ) as executor:
+            results = executor.map(fn, names)
+            for _ in names:
+                with stage("scan"):
+                    result = next(results)
+                yield result
+    else:
+        for input in inputs:
+            with stage("scan"):
+                result = fn(input)
+            yield result
+
+
+def _init_worker(decoding: Optional[InputDecoding]):
+    # workers which are not forked do not inherit the options
+    global input_decoding
+    input_decoding = decoding
+
+
+def _map_cached[R](
+    fn: Callable[[BinaryIO | str], R],
+    inputs: Sequence[BinaryIO],
+    names: list[str],
+    jobs: int,
+    result_cache: cache.ResultCache,
+    cache_key: str,
+) -> Iterator[R]:
+    from reven import cache
+
+    operation = result_cache.operation_key(cache_key)
+    with contextlib.closing(result_cache):
+        with stage("cache"):
+            digests = [result_cache.known_digest(name) for name in names]
+            sizes = [os.path.getsize(name) for name in names]
+
+        # files with identical content have the same size, so only unknown files whose
+        # size is shared are hashed before processing, to find their duplicates. Other
+        # files are hashed by the workers, from the mapping they scan, so that a cold
+        # run reads every file once and in parallel.
+        size_counts = collections.Counter(sizes)
+        shared = [
+            i
+            for i, digest in enumerate(digests)
+            if digest is None and size_counts[sizes[i]] > 1
+        ]
+        shared_names = [names[i] for i in shared]
+        hashed = _map_inputs(cache.file_digest, shared_names, shared_names, jobs)
+        for i, digest in zip(shared, hashed):
+            with stage("cache"):
+                result_cache.set_digest(names[i], digest)
+            digests[i] = digest
+
+        # process inputs with unknown digests and the first input of every known digest
+        # without a result
+        with stage("cache"):
+            missing: set[int] = set()
+            seen: set[str] = set()
+            for i, digest in enumerate(digests):
+                if digest is None:
+                    missing.add(i)
+                elif digest not in seen:
+                    seen.add(digest)
+                    if not result_cache.contains(digest, operation):
+                        missing.add(i)
+        computed = _map_inputs(
+            functools.partial(_digest_and_apply, fn),
+            [inputs[i] for i in sorted(missing)],
+            [names[i] for i in sorted(missing)],
+            jobs,
+        )
+
+        # results of duplicates are kept until their last occurrence
+        last = {digest: i for i, digest in enumerate(digests) if digest is not None}
+        pending: dict[str, R] = {}
+        for i, digest in enumerate(digests):
+            if i in missing:
+                new_digest, result = next(computed)
+                with stage("cache"):
+                    if digest is None:
+                        result_cache.set_digest(names[i], new_digest)
+                    result_cache.put(new_digest, operation, result)
+            elif digest in pending:
+                result = pending[digest]
+            else:
+                with stage("cache"):
+                    result = result_cache.get(digest, operation)
+            if digest is not None:
+                if last[digest] > i:
+                    pending[digest] = result
+                else:
+                    pending.pop(digest, None)
+            yield result
+
+        if missing and result_cache.size() > result_cache.max_size:
+            result_cache.prune()
+
+
+def _digest_and_apply[R](
+    fn: Callable[[BinaryIO | MappedInput | str], R], input: BinaryIO | str
+) -> tuple[str, R]:
+    from reven import cache
+
+    # the digest is of the undecoded content, and fn decodes the mapping if needed
+    with map_input(input, decode=False) as data:
+        with stage("cache"):
+            digest = cache.data_digest(data)
+        return digest, fn(MappedInput(input_name(input), data))
+
+
+MIN_THREAD_CHUNK_SIZE = 1 << 22
+
+
+def search_threaded(
+    search: Callable[[memoryview], list[array]],
+    data: bytes | mmap.mmap,
+    overlap: int,
+    threads: int,
+    unit: int = 1,
+) -> list[array]:
+    """Splits data into one chunk per thread and runs search on the chunks concurrently,
+    which requires search to release the GIL. Chunks are extended by overlap bytes so
+    that matches straddling a boundary are found, and every match is only reported by
+    the chunk it starts in. Positions are measured in units per byte, e.g. 2 for nibbles."""
+    with memoryview(data) as view:
+        size = max(-(-len(view) // max(threads, 1)), MIN_THREAD_CHUNK_SIZE)
+        if size >= len(view):
+            return search(view)
+
+        def search_chunk(start: int) -> list[array]:
+            end = min(start + size, len(view))
+            with view[start : end + overlap] as chunk:
+                results = search(chunk)
+            # the last chunk owns every match it finds
+            limit = (end - start) * unit if end < len(view) else math.inf
+            return [array("Q", (start * unit + p for p in r if p < limit)) for r in results]
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(threads) as executor:
+            chunks = list(executor.map(search_chunk, range(0, len(view), size)))
+        return [sum(results, array("Q")) for results in zip(*chunks)]
+
+
+def count_threaded(
+    count: Callable[[memoryview], list[int]],
+    data: bytes | mmap.mmap,
+    overlap: int,
+    threads: int,
+) -> list[int]:
+    """Counts matches like search_threaded. Matches starting in the overlap of a chunk
+    lie entirely within the overlap, so they are excluded by counting the overlap."""
+    with memoryview(data) as view:
+        size = max(-(-len(view) // max(threads, 1)), MIN_THREAD_CHUNK_SIZE)
+        if size >= len(view):
+            return count(view)
+
+        def count_chunk(start: int) -> list[int]:
+            end = min(start + size, len(view))
+            with view[start : end + overlap] as chunk:
+                counts = count(chunk)
+            if end < len(view):
+                with view[end : end + overlap] as tail:
+                    counts = [a - b for a, b in zip(counts, count(tail))]
+            return counts
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(threads) as executor:
+            chunks = list(executor.map(count_chunk, range(0, len(view), size)))
+        return [sum(counts) for counts in zip(*chunks)]
+
+
+STREAM_CHUNK_SIZE = 1 << 26
+
+
+def search_stream(
+    search: Callable[[bytes], list[array]],
+    file: BinaryIO,
+    spans: list[int],
+    unit: int = 1,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> Iterator[list[array]]:
+    """Searches a file one chunk at a time, so that memory is bounded by the chunk size,
+    and yields the positions found in every chunk. spans holds the length of a match,
+    in units per byte, for each list of positions returned by search. The tail of every
+    chunk is carried over to the next one so that matches straddling chunks are found,
+    and matches lying entirely within the carried tail are skipped as already reported."""
+    overlap = -(-max(spans, default=0) // unit)
+    offset = 0
+    carry = b""
+    while chunk := file.read(chunk_size):
+        buffer = carry + chunk
+        carried = len(carry) * unit
+        yield [
+            array(
+                "Q",
+                (offset * unit + p for p in positions if not carry or p + span > carried),
+            )
+            for positions, span in zip(search(buffer), spans)
+        ]
+        carry = buffer[max(len(buffer) - overlap, 0) :] if overlap else b""
+        offset += len(buffer) - len(carry)
+
+
+def count_stream(
+    count: Callable[[bytes], list[int]],
+    file: BinaryIO,
+    overlap: int,
+    chunk_size: int = STREAM_CHUNK_SIZE,
+) -> list[int]:
+    """Counts matches like search_stream. Matches lying entirely within the carried tail
+    were counted with the previous chunk, so they are excluded by counting the tail."""
+    totals = None
+    carry = b""
+    while chunk := file.read(chunk_size):
+        buffer = carry + chunk
+        counts = count(buffer)
+        if carry:
+            counts = [a - b for a, b in zip(counts, count(carry))]
+        totals = counts if totals is None else [a + b for a, b in zip(totals, counts)]
+        carry = buffer[max(len(buffer) - overlap, 0) :] if overlap else b""
+    return totals if totals is not None else count(b"")
 
 
 class Nibbles:
-    def __init__(self, data: bytes):
+    """The nibbles of a buffer, high nibble first. Slicing returns a view of the same
+    buffer, and the nibbles are expanded into a NumPy array only when needed."""
+
+    def __init__(self, data: bytes, start: int = 0, stop: Optional[int] = None):
         self.data = data
+        self.start = start
+        self.stop = len(data) * 2 if stop is None else stop
 
-    def __iter__(self):
-        return Nibbles.__NibblesIterator(self)
+    @functools.cached_property
+    def array(self) -> np.ndarray:
+        import numpy as np
 
-    def __len__(self) -> int:
-        return len(self.data) * 2
+        data = np.frombuffer(self.data, dtype=np.uint8)[
+            self.start // 2 : (self.stop + 1) // 2
+        ]
+        nibbles = np.empty(len(data) * 2, dtype=np.uint8)
+        nibbles[0::2] = data >> 4
+        nibbles[1::2] = data & 0xF
+        offset = self.start % 2
+        return nibbles[offset : offset + len(self)]
 
-    def __getitem__(self, index: int) -> int:
-        (quot, rem) = (index // 2, index % 2)
-        match rem:
-            case 0:
-                return (self.data[quot] & 0xF0) >> 4
-            case 1:
-                return self.data[quot] & 0xF
+    @staticmethod
+    def stack(bufs: Sequence[Nibbles]) -> np.ndarray:
+        """Stacks the nibbles of every buffer into a matrix, cut to the shortest one."""
+        import numpy as np
 
-    def __contains__(self, value: int) -> bool:
-        for i in self:
-            if i == value:
-                return True
-        return False
+        if not bufs:
+            return np.empty((0, 0), dtype=np.uint8)
+        length = min(len(buf) for buf in bufs)
+        return np.stack([buf.array[:length] for buf in bufs])
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.array if dtype is None else self.array.astype(dtype)
 
-    class __NibblesIterator:
-        def __init__(self, nibbles: Nibbles):
-            self.index = 0
-            self.nibbles = nibbles
+    def __buffer__(self, flags: int) -> memoryview:
+        return memoryview(self.array)
 
-        def __iter__(self):
-            return self
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.array.tolist())
 
-        def __next__(self):
-            if self.index >= len(self.nibbles):
-                raise StopIteration
-            v = self.nibbles[self.index]
-            self.index += 1
-            return v
+    def __len__(self) -> int:
+        return self.stop - self.start
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return self.array[index]
+            return Nibbles(
+                self.data, self.start + start, self.start + max(start, stop)
+            )
+
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("nibble index out of range")
+        index += self.start
+        byte = self.data[index >> 1]
+        return byte & 0xF if index & 1 else byte >> 4
+
+    def __contains__(self, value: int) -> bool:
+        return bool((self.array == value).any())
 
 
 class NibblesTests(unittest.TestCase):
@@ -234,3 +1000,69 @@ class NibblesTests(unittest.TestCase):
         nibbles = Nibbles(b"\xde\xad")
         self.assertFalse(0xC in nibbles)
         self.assertTrue(0xA in nibbles)
+
+    def test_slice(self):
+        nibbles = Nibbles(b"\xde\xad\xbe\xef")[1:6]
+        self.assertEqual(list(nibbles), [0xE, 0xA, 0xD, 0xB, 0xE])
+        self.assertEqual(list(nibbles[1:-1]), [0xA, 0xD, 0xB])
+        self.assertEqual(nibbles[-1], 0xE)
+        self.assertEqual(nibbles.array.tolist(), list(nibbles))
+        self.assertFalse(0xF in nibbles)
+
+    def test_stack(self):
+        matrix = Nibbles.stack([Nibbles(b"\xde\xad"), Nibbles(b"\xbe")])
+        self.assertEqual(matrix.tolist(), [[0xD, 0xE], [0xB, 0xE]])
+
+
+class TableTests(unittest.TestCase):
+    def test_summarize_values(self):
+        values = range(MAX_CELL_VALUES + 2)
+        self.assertEqual(summarize_values(values[:3], str), "0 1 2")
+        self.assertTrue(summarize_values(values, str).endswith(" … (2 more)"))
+
+    def test_sort(self):
+        rows = [StatsValue("a", "2"), StatsValue("c", "1"), StatsValue("b", "3")]
+        self.assertEqual(
+            ["c", "b", "a"], [row.name for row in _sorted(StatsValue, rows, "-name")]
+        )
+        with self.assertRaises(typer.BadParameter):
+            _sorted(StatsValue, rows, "size")
+
+
+class StatsTests(unittest.TestCase):
+    def test_nested_stages(self):
+        stats = Stats()
+        with stats.stage("outer"):
+            time.sleep(0.01)
+            with stats.stage("inner"):
+                time.sleep(0.02)
+        report = stats.report()
+        self.assertGreaterEqual(report["stages"]["inner"]["wall"], 0.02)
+        self.assertGreaterEqual(report["stages"]["outer"]["wall"], 0.01)
+        # the time of the inner stage is not counted in the outer one too
+        self.assertLessEqual(
+            sum(stage["wall"] for stage in report["stages"].values()),
+            report["wall"] + 1e-6,
+        )
+
+
+class RecordsTests(unittest.TestCase):
+    def write(self, records: Iterable[Any]) -> TextIO:
+        output = io.BytesIO()
+        file = io.TextIOWrapper(output, write_through=True)
+        write_records(file, records)
+        file.flush()
+        return io.TextIOWrapper(io.BufferedReader(io.BytesIO(output.getvalue())))
+
+    def test_round_trip(self):
+        global output_format
+        records = [{"file_name": "a", "data": b"\x00\xff"}, {"file_name": "b"}]
+        try:
+            for output_format in OutputFormat:
+                read = list(read_records(self.write(iter(records))))
+                data = converter.structure(read[0]["data"], bytes)
+                self.assertEqual(b"\x00\xff", data)
+                self.assertEqual("b", read[1]["file_name"])
+                self.assertEqual([], list(read_records(self.write([]))))
+        finally:
+            output_format = OutputFormat.YAML
@@ -1,28 +1,136 @@
+import cProfile
+import json
+import sys
+from pathlib import Path
+from typing import Optional
 import typer
+from typing_extensions import Annotated
 
-from reven.lib import load_plugin_apps
+from reven import cache as result_cache
+from reven import lib
+from reven.lib import InputDecoding, OutputFormat
+
+from .lazy import LazyGroup
+
+
+class Commands(LazyGroup):
+    # the modules of commands are imported when they are run, since some of them, such
+    # as upset and find-patterns-grouped, depend on libraries which are slow to import
+    lazy_commands = {
+        "search": "reven.ops.search",
+        "transform": "reven.ops.transform",
+        "byte-freq": "reven.ops.byte_freq",
+        "find-patterns-grouped": "reven.ops.pattern",
+        "find-patterns": "reven.ops.pattern",
+        "upset": "reven.ops.upset",
+        "slice": "reven.ops.slice",
+        "hex2bin": "reven.ops.hex2bin",
+        "ngram": "reven.ops.ngram",
+        "entropy": "reven.ops.entropy",
+        "cache": "reven.ops.cache",
+        "index": "reven.ops.index",
+    }
 
-from . import search
-from . import transform
-from . import byte_freq
-from . import pattern
-from . import upset
-from . import slice
-from . import hex2bin
-from . import ngram
 
 app = typer.Typer(
-    help="Operations for reverse engineering sets of files such as firmware and other binaries."
+    cls=Commands,
+    help="Operations for reverse engineering sets of files such as firmware and other binaries.",
 )
 
-app.add_typer(search.app)
-app.add_typer(transform.app)
-app.add_typer(byte_freq.app)
-app.add_typer(pattern.app)
-app.add_typer(upset.app)
-app.add_typer(slice.app)
-app.add_typer(hex2bin.app)
-app.add_typer(ngram.app)
-
-for plugin_app in load_plugin_apps():
-    app.add_typer(plugin_app)
+
+@app.callback()
+def callback(
+    ctx: typer.Context,
+    no_cache: Annotated[
+        bool,
+        typer.Option(
+            "--no-cache",
+            help="Neither read nor store cached results of per-file operations.",
+        ),
+    ] = False,
+    output_format: Annotated[
+        OutputFormat,
+        typer.Option(
+            "--format",
+            "--output-format",
+            help="The format of results written to files and pipes. JSON Lines and \
+binary records can be consumed one record at a time, and binary records hold bytes \
+without encoding them.",
+        ),
+    ] = OutputFormat.YAML,
+    stats: Annotated[
+        bool,
+        typer.Option(
+            "--stats",
+            help="Print the time spent opening, scanning and serializing, the \
+throughput and the peak memory usage to stderr.",
+        ),
+    ] = False,
+    stats_file: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--stats-file", help="Write the statistics of --stats as JSON to a file."
+        ),
+    ] = None,
+    decode: Annotated[
+        Optional[InputDecoding],
+        typer.Option(
+            "--decode",
+            help="Decode inputs from Intel HEX or Motorola S-records to the binary \
+images they describe before processing them. auto decodes inputs in either format, \
+and passes other inputs through.",
+        ),
+    ] = None,
+    limit: Annotated[
+        Optional[int],
+        typer.Option(
+            "--limit",
+            help=f"The maximum number of results written. Tables on terminals show \
+{lib.DEFAULT_TABLE_LIMIT} rows by default, and 0 shows every row.",
+        ),
+    ] = None,
+    sort: Annotated[
+        Optional[str],
+        typer.Option(
+            "--sort",
+            help="The attribute to sort results by, such as count, in descending order \
+if prefixed with -. Lists such as positions are sorted by their length.",
+        ),
+    ] = None,
+    profile: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--profile",
+            help="Profile the command with cProfile and write the profile to a file, \
+e.g. to be viewed with snakeviz.",
+        ),
+    ] = None,
+):
+    result_cache.enabled = not no_cache
+    lib.output_format = output_format
+    lib.input_decoding = decode
+    lib.table_limit = limit
+    lib.table_sort = sort
+
+    if stats or stats_file:
+        lib.stats = lib.Stats()
+
+        def report():
+            report = lib.stats.report()
+            if stats:
+                lib.print_stats(report, sys.stderr)
+            if stats_file:
+                stats_file.write_text(json.dumps(report, indent=2))
+
+        ctx.call_on_close(report)
+
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+        def dump():
+            profiler.disable()
+            profiler.dump_stats(profile)
+
+        # registered last, so that it is called before the statistics are reported
+        ctx.call_on_close(dump)
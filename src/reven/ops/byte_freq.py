@@ -1,8 +1,12 @@
-from typing import Annotated, Optional
+from array import array
+from typing import Annotated, BinaryIO, Optional
 import attr
+import math
 import typer
 import sys
-from reven.lib import Tabular
+import unittest
+import reven.fast.stats as fast_stats
+from reven.lib import Tabular, map_input, process_inputs
 
 app = typer.Typer()
 
@@ -16,9 +20,42 @@ class ByteFrequency(Tabular):
 @attr.s(auto_attribs=True, frozen=True)
 class FileFrequencies(Tabular):
     file_name: str
+    entropy: float
+    chi_square: float
     frequencies: list[ByteFrequency]
 
 
+def entropy(counts: array) -> float:
+    """Returns the Shannon entropy of a byte histogram in bits per byte."""
+    length = sum(counts)
+    return -sum(c / length * math.log2(c / length) for c in counts if c) + 0.0
+
+
+def chi_square(counts: array) -> float:
+    """Returns the chi-square statistic of a byte histogram against a uniform
+    distribution."""
+    length = sum(counts)
+    if length == 0:
+        return 0.0
+    expected = length / 256
+    return sum((c - expected) ** 2 for c in counts) / expected
+
+
+def _count_input(input: BinaryIO | str) -> array:
+    with map_input(input) as data:
+        return fast_stats.histogram(data)
+
+
+def _file_frequencies(file_name: str, counts: array) -> FileFrequencies:
+    length = sum(counts) or 1
+    return FileFrequencies(
+        file_name=file_name,
+        entropy=entropy(counts),
+        chi_square=chi_square(counts),
+        frequencies=[ByteFrequency(v, counts[v] / length) for v in range(0, 256)],
+    )
+
+
 @app.command(help="Calculates the byte frequencies of stdin or the given inputs.")
 def byte_freq(
     inputs: Annotated[
@@ -28,20 +65,55 @@ def byte_freq(
         ),
     ] = None,
     output: typer.FileTextWrite = sys.stdout,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="The number of files to process in parallel. 0 uses every available core.",
+        ),
+    ] = 1,
+    aggregate: Annotated[
+        bool,
+        typer.Option(
+            "--aggregate",
+            help="Combine the inputs into a single histogram instead of one per input.",
+        ),
+    ] = False,
 ):
     if not inputs:
         inputs = [sys.stdin.buffer]
 
-    freqs = []
-    for input in inputs:
-        data = input.read()
-        freqs.append(
-            FileFrequencies(
-                file_name=input.name,
-                frequencies=[
-                    ByteFrequency(v, data.count(v) / len(data)) for v in range(0, 256)
-                ],
-            )
-        )
+    results = process_inputs(_count_input, inputs, jobs, cache_key="byte-freq")
+    if aggregate:
+        total = array("Q", bytes(256 * 8))
+        for counts in results:
+            for v in range(0, 256):
+                total[v] += counts[v]
+        freqs = [_file_frequencies("<aggregate>", total)]
+    else:
+        freqs = [
+            _file_frequencies(input.name, counts)
+            for counts, input in zip(results, inputs)
+        ]
 
     FileFrequencies.tabular_write(output, freqs)
+
+
+class StatisticsTests(unittest.TestCase):
+    def test_uniform(self):
+        counts = fast_stats.histogram(bytes(range(256)) * 4)
+        self.assertEqual([4] * 256, counts.tolist())
+        self.assertEqual(8.0, entropy(counts))
+        self.assertEqual(0.0, chi_square(counts))
+
+    def test_constant(self):
+        counts = fast_stats.histogram(b"\x00" * 256)
+        self.assertEqual(0.0, entropy(counts))
+        self.assertEqual(255 * 256, chi_square(counts))
+
+    def test_empty(self):
+        frequencies = _file_frequencies("empty", fast_stats.histogram(b""))
+        self.assertEqual(0.0, frequencies.entropy)
+        self.assertEqual(0.0, frequencies.chi_square)
+        self.assertEqual(0.0, frequencies.frequencies[0].frequency)
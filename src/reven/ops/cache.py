@@ -0,0 +1,58 @@
+from typing import Annotated, Optional
+import attr
+import typer
+import sys
+from reven import cache as result_cache
+from reven.lib import Tabular, TabularColumn
+
+app = typer.Typer()
+cache_app = typer.Typer(name="cache", help="Inspects and prunes the result cache.")
+app.add_typer(cache_app)
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class CacheStats(Tabular):
+    location: str
+    entries: int
+    files: int
+    size: Annotated[int, TabularColumn(name="Size (Bytes)")]
+
+
+def _open_cache() -> result_cache.ResultCache:
+    path = result_cache.cache_dir() / "results.sqlite"
+    try:
+        return result_cache.ResultCache(path)
+    except Exception as e:
+        print(f"Failed to open the cache at {path}: {e}", file=sys.stderr)
+        raise typer.Exit(1)
+
+
+@cache_app.command(help="Shows the number and size of cached results.")
+def stats(
+    output: Annotated[typer.FileTextWrite, typer.Option("--output", "-o")] = sys.stdout,
+):
+    store = _open_cache()
+    try:
+        dto = CacheStats(location=str(store.path), **store.stats())
+    finally:
+        store.close()
+    CacheStats.tabular_write(output, [dto])
+
+
+@cache_app.command(help="Evicts the least recently used results from the cache.")
+def prune(
+    max_size: Annotated[
+        Optional[int],
+        typer.Option(
+            "--max-size",
+            help="The number of bytes to keep. Defaults to the maximum size of the cache, \
+0 empties it.",
+        ),
+    ] = None,
+):
+    store = _open_cache()
+    try:
+        evicted = store.prune(max_size)
+    finally:
+        store.close()
+    print(f"Evicted {evicted} results.", file=sys.stderr)
@@ -0,0 +1,137 @@
+from array import array
+from typing import Annotated, BinaryIO, Optional
+import attr
+import functools
+import typer
+import sys
+import unittest
+import reven.fast.stats as fast_stats
+from reven.lib import Tabular, TabularColumn, map_input, process_inputs
+from reven.ops import byte_freq
+
+app = typer.Typer()
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class EntropyWindow(Tabular):
+    file_name: str
+    position: Annotated[
+        int, TabularColumn(name="Position (Hex)", format=lambda _, x: f"{x:x}")
+    ]
+    length: int
+    entropy: Annotated[
+        float,
+        TabularColumn(
+            highlight=lambda _, x: "bold red" if x > 7.5 else None,
+            format=lambda _, x: f"{x:.3f}",
+        ),
+    ]
+    zero_ratio: Annotated[float, TabularColumn(format=lambda _, x: f"{x:.3f}")]
+    ff_ratio: Annotated[float, TabularColumn(format=lambda _, x: f"{x:.3f}")]
+    printable_ratio: Annotated[float, TabularColumn(format=lambda _, x: f"{x:.3f}")]
+
+
+def _window_stats(
+    window: int, stride: int, input: BinaryIO | str
+) -> tuple[int, array, array, array, array]:
+    with map_input(input) as data:
+        return len(data), *fast_stats.window_stats(data, window, stride)
+
+
+@app.command(
+    help="Calculates the entropy and byte class ratios of sliding windows over stdin or \
+the given inputs."
+)
+def entropy(
+    inputs: Annotated[
+        Optional[list[typer.FileBinaryRead]],
+        typer.Argument(
+            help="The input files to calculate the entropy of. Defaults to stdin."
+        ),
+    ] = None,
+    output: typer.FileTextWrite = sys.stdout,
+    window: Annotated[
+        int,
+        typer.Option("--window", "-w", help="The size in bytes of every window."),
+    ] = 1024,
+    stride: Annotated[
+        Optional[int],
+        typer.Option(
+            "--stride",
+            "-s",
+            help="The distance in bytes between windows. Defaults to the window size.",
+        ),
+    ] = None,
+    min_entropy: Annotated[
+        Optional[float],
+        typer.Option(help="Only report windows with at least this entropy."),
+    ] = None,
+    max_entropy: Annotated[
+        Optional[float],
+        typer.Option(help="Only report windows with at most this entropy."),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="The number of files to process in parallel. 0 uses every available core.",
+        ),
+    ] = 1,
+):
+    if not inputs:
+        inputs = [sys.stdin.buffer]
+    if stride is None:
+        stride = window
+
+    results = process_inputs(
+        functools.partial(_window_stats, window, stride),
+        inputs,
+        jobs,
+        cache_key=f"entropy:{window}:{stride}",
+    )
+    windows = []
+    for (size, entropies, zeros, ffs, printables), input in zip(results, inputs):
+        for i, value in enumerate(entropies):
+            if min_entropy is not None and value < min_entropy:
+                continue
+            if max_entropy is not None and value > max_entropy:
+                continue
+            windows.append(
+                EntropyWindow(
+                    file_name=input.name,
+                    position=i * stride,
+                    length=min(window, size),
+                    entropy=value,
+                    zero_ratio=zeros[i],
+                    ff_ratio=ffs[i],
+                    printable_ratio=printables[i],
+                )
+            )
+
+    EntropyWindow.tabular_write(output, windows)
+
+
+class WindowStatsTests(unittest.TestCase):
+    def test_sliding(self):
+        data = bytes(range(256)) + b"\x00" * 256 + b"\xff" * 128 + b"abc" * 100
+        for window, stride in ((256, 256), (256, 64), (100, 7), (500, 1)):
+            stats = fast_stats.window_stats(data, window, stride)
+            self.assertEqual((len(data) - window) // stride + 1, len(stats[0]))
+            for i, values in enumerate(zip(*stats)):
+                chunk = data[i * stride : i * stride + window]
+                counts = fast_stats.histogram(chunk)
+                expected = (
+                    byte_freq.entropy(counts),
+                    chunk.count(0) / window,
+                    chunk.count(0xFF) / window,
+                    sum(0x20 <= c < 0x7F or c in b"\t\n\r" for c in chunk) / window,
+                )
+                for value, expected_value in zip(values, expected):
+                    self.assertAlmostEqual(expected_value, value)
+
+    def test_short(self):
+        stats = fast_stats.window_stats(b"\x00\x01", 1024, 1024)
+        self.assertEqual([1.0], stats[0].tolist())
+        stats = fast_stats.window_stats(b"", 1024, 1024)
+        self.assertEqual([], stats[0].tolist())
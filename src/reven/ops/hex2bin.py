@@ -1,54 +1,79 @@
 from pathlib import Path
+from typing import Annotated, BinaryIO, Optional
+import functools
 import typer
-import tempfile
 import sys
-import subprocess
+from reven import hexfile
+from reven.hexfile import HexFormat
+from reven.lib import open_input, process_inputs
 
 app = typer.Typer()
 
 
-@app.command(help="Command for converting Intel HEX files to binary files.")
+def _convert(
+    format: Optional[HexFormat],
+    fill: int,
+    output_dir: Optional[Path],
+    input: BinaryIO | str,
+) -> Optional[bytearray]:
+    with open_input(input, decode=False) as file:
+        name = input if isinstance(input, str) else file.name
+        format = format or hexfile.detect_file(file)
+        if format is None:
+            raise ValueError(f"{name} is neither Intel HEX nor an S-record file")
+        try:
+            image = hexfile.decode(file, format, fill)
+        except ValueError as e:
+            raise ValueError(f"{name}: {e}") from None
+
+    if output_dir is None:
+        return image
+    # workers write their images, so that they are not passed back
+    output_dir.joinpath(name.split("/")[-1].replace(".hex", ".bin")).write_bytes(image)
+    return None
+
+
+@app.command(
+    help="Command for converting Intel HEX and Motorola S-record files to binary files. \
+Gaps between records are filled, as by objcopy -O binary."
+)
 def hex2bin(
-    input: list[typer.FileText],
+    input: list[typer.FileBinaryRead],
     output: typer.FileBinaryWrite = sys.stdout.buffer,
     output_dir: Path = None,
+    format: Annotated[
+        Optional[HexFormat],
+        typer.Option(
+            "--hex-format", help="The format of the inputs. Detected by default."
+        ),
+    ] = None,
+    fill: Annotated[
+        int,
+        typer.Option(
+            "--fill",
+            help="The byte filling gaps, e.g. 255 for erased flash.",
+            min=0,
+            max=255,
+        ),
+    ] = 0,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="The number of files to convert in parallel. 0 uses every available \
+core.",
+        ),
+    ] = 1,
 ):
-    outputs = [output]
     if output_dir is not None:
         output_dir.mkdir(parents=True, exist_ok=True)
-        outputs = [
-            open(
-                output_dir.joinpath(file.name.split("/")[-1].replace(".hex", ".bin")),
-                "wb",
-            )
-            for file in input
-        ]
-
-    for file_in, file_out in zip(input, outputs):
-        # Nordic nRF uses Intel HEX https://en.wikipedia.org/wiki/Intel_HEX
-        with (
-            tempfile.NamedTemporaryFile(delete_on_close=False) as fin,
-            tempfile.NamedTemporaryFile(delete_on_close=False) as fout,
-        ):
-            fin.write(file_in.buffer.read())
-            fin.close()
-            fout.close()
-            proc = subprocess.run(
-                [
-                    "objcopy",
-                    "--input-target",
-                    "ihex",
-                    "--output-target",
-                    "binary",
-                    fin.name,
-                    fout.name,
-                ],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-            )
-            if proc.returncode != 0:
-                raise Exception(f"{proc.stdout.decode('utf-8').strip()}")
 
-            with open(fout.name, "rb") as f:
-                file_out.write(f.read())
-                file_out.close()
+    worker = functools.partial(_convert, format, fill, output_dir)
+    try:
+        for image in process_inputs(worker, input, jobs=jobs, progress=True):
+            if image is not None:
+                output.write(image)
+    except ValueError as e:
+        print(f"Failed to convert: {e}", file=sys.stderr)
+        raise typer.Exit(1)
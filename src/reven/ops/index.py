@@ -0,0 +1,51 @@
+from pathlib import Path
+from typing import Annotated
+import typer
+import sys
+from reven.index import MAX_TRIGRAMS, NgramIndex, walk_files
+
+app = typer.Typer()
+index_app = typer.Typer(
+    name="index", help="Builds trigram indexes which speed up searches of a corpus."
+)
+app.add_typer(index_app)
+
+
+@index_app.command(
+    help="Indexes the trigrams of every file below the given paths. Search the index \
+with `search --index`."
+)
+def build(
+    corpus: Annotated[
+        list[Path],
+        typer.Argument(help="The files and directories to index.", exists=True),
+    ],
+    index: Annotated[
+        Path,
+        typer.Option("--index", "-x", help="The directory to write the index to."),
+    ] = Path(".reven-index"),
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="The number of files to read in parallel. 0 uses every available core.",
+        ),
+    ] = 1,
+    max_trigrams: Annotated[
+        int,
+        typer.Option(
+            "--max-trigrams",
+            help="Files with more distinct trigrams, such as compressed data, are not \
+indexed and always searched.",
+        ),
+    ] = MAX_TRIGRAMS,
+):
+    files = list(walk_files(corpus, exclude=index))
+    ngram_index = NgramIndex.build(index, files, jobs, max_trigrams)
+    print(
+        f"Indexed {len(ngram_index)} files ({len(ngram_index.unindexed)} always \
+searched) with {len(ngram_index.trigrams)} trigrams and \
+{len(ngram_index.postings)} postings.",
+        file=sys.stderr,
+    )
@@ -0,0 +1,156 @@
+import functools
+import importlib
+import importlib.metadata
+import json
+import os
+import pkgutil
+import sys
+import unittest
+from typing import Optional
+import click
+import typer
+from typer.core import TyperGroup
+from reven.cache import cache_dir
+
+PLUGIN_GROUP = "reven.plugins"
+# modules named like this were loaded as plugins before entry points were supported
+LEGACY_PLUGIN_PREFIX = "reven_plugin_"
+
+
+def _load(target: str) -> click.Command:
+    """Imports the Typer app at module:attribute, where the attribute defaults to app,
+    and converts it to a click command."""
+    module, _, attribute = target.partition(":")
+    app = getattr(importlib.import_module(module), attribute or "app")
+    return typer.main.get_command(app)
+
+
+def load_command(target: str, name: str) -> Optional[click.Command]:
+    command = _load(target)
+    if isinstance(command, click.Group):
+        return command.commands.get(name)
+    return command if command.name == name else None
+
+
+def _discover_plugins() -> dict[str, str]:
+    targets = [
+        entry_point.value
+        for entry_point in importlib.metadata.entry_points(group=PLUGIN_GROUP)
+    ]
+    targets += [
+        name
+        for _, name, _ in pkgutil.iter_modules()
+        if name.startswith(LEGACY_PLUGIN_PREFIX)
+    ]
+
+    commands = {}
+    for target in targets:
+        try:
+            command = _load(target)
+        except Exception as e:
+            print(f"Failed to load plugin {target}: {e}", file=sys.stderr)
+            continue
+        names = command.commands if isinstance(command, click.Group) else [command.name]
+        commands.update((name, target) for name in names)
+    return commands
+
+
+def _path_fingerprint() -> list[tuple[str, int]]:
+    # installing or removing a package changes the modification time of its directory,
+    # while the working directory changes too often to be taken into account
+    cwd = os.getcwd()
+    return [
+        (entry, os.stat(entry).st_mtime_ns)
+        for entry in sys.path
+        if entry and os.path.isdir(entry) and os.path.realpath(entry) != cwd
+    ]
+
+
+@functools.cache
+def plugin_commands() -> dict[str, str]:
+    """Returns the commands of installed plugins and the apps they belong to. Finding
+    plugins imports them, so they are cached until the packages on sys.path change."""
+    path = cache_dir() / "plugins.json"
+    fingerprint = [list(item) for item in _path_fingerprint()]
+    try:
+        registry = json.loads(path.read_text())
+        if registry["fingerprint"] == fingerprint:
+            return registry["commands"]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    commands = _discover_plugins()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"fingerprint": fingerprint, "commands": commands}))
+    except OSError:
+        pass
+    return commands
+
+
+class LazyGroup(TyperGroup):
+    """A group which imports the module of a command only when the command is run, and
+    the modules of every command when help is shown. Subclasses map the names of their
+    commands to the Typer apps defining them in lazy_commands."""
+
+    lazy_commands: dict[str, str] = {}
+
+    def list_commands(self, ctx: click.Context) -> list[str]:
+        names = [*super().list_commands(ctx), *self.lazy_commands]
+        names += [name for name in plugin_commands() if name not in names]
+        return names
+
+    def get_command(self, ctx: click.Context, name: str) -> Optional[click.Command]:
+        command = super().get_command(ctx, name)
+        if command is not None:
+            return command
+        target = self.lazy_commands.get(name) or plugin_commands().get(name)
+        return load_command(target, name) if target else None
+
+
+# subprocess, tempfile and unittest.mock are imported by the tests, since this module is
+# imported by every command
+class StartupTests(unittest.TestCase):
+    HEAVY_MODULES = {"sklearn", "scipy", "pandas", "matplotlib", "upsetplot"}
+    # search depends on NumPy for patterns and indexes, while these commands do not
+    NUMPY_FREE_COMMANDS = {"slice", "byte-freq"}
+
+    def test_lazy_imports(self):
+        import subprocess
+
+        for command in ("slice", "search", "byte-freq"):
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    "-X",
+                    "importtime",
+                    "-m",
+                    "reven.main",
+                    command,
+                    "--help",
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            imported = {
+                line.rsplit("|", 1)[-1].strip().split(".")[0]
+                for line in process.stderr.splitlines()
+            }
+            self.assertFalse(self.HEAVY_MODULES & imported, command)
+            if command in self.NUMPY_FREE_COMMANDS:
+                self.assertNotIn("numpy", imported, command)
+
+    def test_plugin_registry(self):
+        import tempfile
+        from unittest import mock
+
+        plugins = {"plugin-command": "reven_plugin_test:app"}
+        with tempfile.TemporaryDirectory() as dir, mock.patch.dict(
+            os.environ, {"REVEN_CACHE_DIR": dir}
+        ), mock.patch(
+            f"{__name__}._discover_plugins", return_value=plugins
+        ) as discover:
+            self.assertEqual(plugins, plugin_commands.__wrapped__())
+            self.assertEqual(plugins, plugin_commands.__wrapped__())
+            discover.assert_called_once()
@@ -1,11 +1,24 @@
 import attr
+import functools
+import heapq
 import typer
+import unittest
 
+from array import array
+from typing import BinaryIO, Optional
 from typing_extensions import Annotated
 import sys
 import reven.fast.ngram as fast_ngram
-from reven.lib import is_tty, InputFormat, Tabular, TabularColumn
-import yaml
+from reven.lib import (
+    is_tty,
+    map_input,
+    process_inputs,
+    read_records,
+    InputFormat,
+    Tabular,
+    TabularColumn,
+    summarize_values,
+)
 
 app = typer.Typer()
 
@@ -16,19 +29,101 @@ class FileCount:
     count: int
 
 
+def _format_file_counts(_, file_counts: list[FileCount]) -> str:
+    return summarize_values(file_counts, lambda y: f"{y.file_name}: {y.count}", "\n")
+
+
 @attr.s(auto_attribs=True)
 class Ngram(Tabular):
     ngram: Annotated[bytes, TabularColumn("N-Gram")]
     total_count: int
     file_counts: Annotated[
         list[FileCount],
-        TabularColumn(
-            "File Count(s)",
-            format=lambda _, x: "\n".join(f"{y.file_name}: {y.count}" for y in x),
-        ),
+        TabularColumn("File Count(s)", format=_format_file_counts),
+    ]
+
+
+@attr.s(auto_attribs=True)
+class HeavyHitter(Tabular):
+    ngram: Annotated[str, TabularColumn("N-Gram")]
+    count: Annotated[int, TabularColumn("Count (Upper Bound)")]
+    error: Annotated[int, TabularColumn("Max Error")]
+    file_counts: Annotated[
+        list[FileCount],
+        TabularColumn("Top File Count(s)", format=_format_file_counts),
     ]
 
 
+def _count_input(n: int, min_count: int, input: BinaryIO | str) -> tuple[bytes, array]:
+    with map_input(input) as data:
+        return fast_ngram.count_ngrams(data, n, min_count)
+
+
+def _summarize_input(
+    n: int, sketch_size: int, input: BinaryIO | str
+) -> tuple[bytes, array, array, int]:
+    summary = fast_ngram.Summary(n, sketch_size)
+    with map_input(input) as data:
+        summary.update(data)
+    return summary.items()
+
+
+def top_ngrams(
+    n: int,
+    top_k: int,
+    sketch_size: int,
+    top_files: int,
+    inputs: list[BinaryIO],
+    jobs: int = 1,
+) -> list[HeavyHitter]:
+    """Finds the most frequent n-grams across inputs with a Space-Saving summary of
+    sketch_size n-grams. Files are attributed to an n-gram when it is among the top_k
+    n-grams of their own summary, keeping the top_files files with the most matches."""
+    sketch_size = max(sketch_size, top_k)
+    summary = fast_ngram.Summary(n, sketch_size)
+    attributions: dict[bytes, list[tuple[int, str]]] = {}
+
+    results = process_inputs(
+        functools.partial(_summarize_input, n, sketch_size),
+        inputs,
+        jobs,
+        cache_key=f"ngram-summary:{n}:{sketch_size}",
+    )
+    for items, file in zip(results, inputs):
+        summary.merge(*items)
+        found, counts, _, _ = items
+        for i, count in enumerate(counts[:top_k]):
+            files = attributions.setdefault(found[i * n : (i + 1) * n], [])
+            heapq.heappush(files, (count, file.name))
+            if len(files) > top_files:
+                heapq.heappop(files)
+
+        # forget the files of n-grams which are no longer monitored
+        if len(attributions) > 4 * sketch_size:
+            found = summary.items()[0]
+            monitored = {found[i : i + n] for i in range(0, len(found), n)}
+            attributions = {
+                ngram: files
+                for ngram, files in attributions.items()
+                if ngram in monitored
+            }
+
+    found, counts, errors, _ = summary.items()
+    heavy_hitters = []
+    for i in range(min(top_k, len(counts))):
+        ngram = found[i * n : (i + 1) * n]
+        files = sorted(attributions.get(ngram, []), reverse=True)
+        heavy_hitters.append(
+            HeavyHitter(
+                ngram.hex(),
+                counts[i],
+                errors[i],
+                [FileCount(file_name, count) for count, file_name in files],
+            )
+        )
+    return heavy_hitters
+
+
 @app.command(help="Finds the n-grams for the files provided in stdin and arguments.")
 def ngram(
     n: Annotated[int, typer.Argument(help="The number of bytes per n-gram.")] = 8,
@@ -41,6 +136,44 @@ def ngram(
         InputFormat,
         typer.Option("--stdin-format", "-i", help="The format used to read stdin."),
     ] = InputFormat.FILE_LIST,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="The number of files to process in parallel. 0 uses every available core.",
+        ),
+    ] = 1,
+    min_count: Annotated[
+        int,
+        typer.Option(
+            "--min-count",
+            help="The number of times an n-gram must occur in a file to be reported.",
+        ),
+    ] = 6,
+    top_k: Annotated[
+        Optional[int],
+        typer.Option(
+            "--top-k",
+            help="Only report the k most frequent n-grams across all files, counted \
+approximately in bounded memory.",
+        ),
+    ] = None,
+    sketch_size: Annotated[
+        int,
+        typer.Option(
+            "--sketch-size",
+            help="The number of n-grams monitored by --top-k. Larger sketches give \
+tighter error bounds.",
+        ),
+    ] = 4096,
+    top_files: Annotated[
+        int,
+        typer.Option(
+            "--top-files",
+            help="The number of files with the highest counts reported per n-gram by --top-k.",
+        ),
+    ] = 10,
 ):
     inputs: set[typer.FileBinaryRead] = set(inputs) if inputs else set()
 
@@ -48,22 +181,36 @@ def ngram(
         match stdin_format:
             case InputFormat.FILE_LIST:
                 files = sys.stdin.read().split()
-            case InputFormat.YAML:
-                files = (item["file_name"] for item in yaml.safe_load(sys.stdin))
+            case InputFormat.YAML | InputFormat.BINARY:
+                files = (item["file_name"] for item in read_records(sys.stdin))
 
         inputs.update(typer.FileBinaryRead(open(file, "rb")) for file in files)
 
-    ngrams: dict[str, Ngram] = {}
-    try:
-        for file in inputs:
-            data = file.read()
+    inputs = sorted(inputs, key=lambda x: x.name)
+
+    if top_k is not None:
+        try:
+            heavy_hitters = top_ngrams(n, top_k, sketch_size, top_files, inputs, jobs)
+        except Exception as e:
+            print(f"Failed to find ngrams: {e}", file=sys.stderr)
+            raise exit(1)
 
-            counts: dict[str, int] = fast_ngram.count_ngrams(data, n)
-            counts = dict(
-                filter(lambda x: x[1] > 5, counts.items())
-            )  # Filter to avoid storing every possible ngram.
+        if output:
+            HeavyHitter.tabular_write(output, heavy_hitters)
 
-            for ngram, count in counts.items():
+        return heavy_hitters
+
+    ngrams: dict[str, Ngram] = {}
+    try:
+        results = process_inputs(
+            functools.partial(_count_input, n, min_count),
+            inputs,
+            jobs,
+            cache_key=f"ngram:{n}:{min_count}",
+        )
+        for (found, counts), file in zip(results, inputs):
+            for i, count in enumerate(counts):
+                ngram = found[i * n : (i + 1) * n]
                 if ngram in ngrams:
                     ngrams[ngram].total_count += count
                     ngrams[ngram].file_counts.append(FileCount(file.name, count))
@@ -77,6 +224,44 @@ def ngram(
         raise exit(1)
 
     if output:
-        Ngram.tabular_write(output, list(ngrams.values()))
+        Ngram.tabular_write(output, ngrams.values())
 
     return ngrams
+
+
+class CountNgramsTests(unittest.TestCase):
+    def test_min_count(self):
+        data = bytes(range(16)) * 3 + bytes(range(8)) + b"\xff" * 16
+        for n in (1, 2, 4, 8, 12):
+            found, counts = fast_ngram.count_ngrams(data, n, 4)
+            ngrams = [data[i : i + n] for i in range(len(data) - n + 1)]
+            expected = {x: ngrams.count(x) for x in ngrams if ngrams.count(x) >= 4}
+            self.assertEqual(
+                list(expected.items()),
+                [(found[i * n : (i + 1) * n], c) for i, c in enumerate(counts)],
+            )
+
+
+class TopNgramsTests(unittest.TestCase):
+    def test_uninitialized(self):
+        summary = fast_ngram.Summary.__new__(fast_ngram.Summary)
+        with self.assertRaises(RuntimeError):
+            summary.update(b"data")
+        with self.assertRaises(RuntimeError):
+            summary.items()
+
+    def test_bounds(self):
+        data = bytes(range(256)) + b"\x01\x02" * 64 + b"\xff" * 32
+        summary = fast_ngram.Summary(2, 16)
+        summary.update(data)
+        found, counts, errors, floor = summary.items()
+        self.assertEqual(
+            [b"\x01\x02", b"\x02\x01", b"\xff\xff"],
+            [found[i * 2 : (i + 1) * 2] for i in range(3)],
+        )
+        ngrams = [data[i : i + 2] for i in range(len(data) - 1)]
+        for i, (count, error) in enumerate(zip(counts, errors)):
+            actual = ngrams.count(found[i * 2 : (i + 1) * 2])
+            self.assertLessEqual(count - error, actual)
+            self.assertLessEqual(actual, count)
+        self.assertLessEqual(floor, len(ngrams) // 16)
@@ -1,5 +1,5 @@
+from array import array
 from dataclasses import dataclass
-from sklearn.cluster import HDBSCAN
 from typing_extensions import Annotated
 import typer
 import sys
@@ -9,10 +9,19 @@ import math
 import reven.fast.pattern as pattern_fast
 import functools
 import io
-import yaml
 import cattr
-from typing import Iterator, Union, Literal
-from reven.lib import InputFormat, Nibbles, is_tty
+import numpy as np
+from typing import BinaryIO, Iterable, Iterator, TextIO, Union, Literal
+from reven.lib import (
+    InputFormat,
+    Nibbles,
+    converter,
+    is_tty,
+    read_records,
+    write_value,
+    search_stream,
+    STREAM_CHUNK_SIZE,
+)
 
 app = typer.Typer()
 
@@ -82,19 +91,62 @@ class Pattern:
             )
         )
 
+    @functools.cached_property
+    def segments(self) -> list[bytes]:
+        """The runs of bytes without wildcards."""
+        segments = []
+        start = None
+        for i, byte_mask in enumerate([*self.mask, 0]):
+            if byte_mask == 0xFF and start is None:
+                start = i
+            elif byte_mask != 0xFF and start is not None:
+                segments.append(self.bits[start:i])
+                start = None
+        return segments
+
     @property
     def bytelen(self) -> int:
         return math.ceil(len(self.string) / 2)
 
     def search(
         self, data: bytes, mode: Union[Literal["byte"], Literal["nibble"]] = "byte"
-    ) -> list[int]:
+    ) -> array:
         match mode:
             case "byte":
                 step = 2
             case "nibble":
                 step = 1
-        return pattern_fast.pattern_search(self.string.encode("ascii"), data, step)
+        return pattern_fast.pattern_search(
+            self.bits, self.mask, len(self.string), data, step
+        )
+
+    def count(
+        self, data: bytes, mode: Union[Literal["byte"], Literal["nibble"]] = "byte"
+    ) -> int:
+        match mode:
+            case "byte":
+                step = 2
+            case "nibble":
+                step = 1
+        return pattern_fast.pattern_search(
+            self.bits, self.mask, len(self.string), data, step, True
+        )
+
+    def search_stream(
+        self,
+        file: BinaryIO,
+        mode: Union[Literal["byte"], Literal["nibble"]] = "byte",
+        chunk_size: int = STREAM_CHUNK_SIZE,
+    ) -> Iterator[int]:
+        match mode:
+            case "byte":
+                unit, span = 1, self.bytelen
+            case "nibble":
+                unit, span = 2, len(self.string)
+        for (positions,) in search_stream(
+            lambda data: [self.search(data, mode)], file, [span], unit, chunk_size
+        ):
+            yield from positions
 
     def __str__(self):
         return self.string
@@ -104,19 +156,106 @@ cattr.global_converter.register_unstructure_hook(Pattern, lambda x: x.string)
 cattr.global_converter.register_structure_hook(Pattern, lambda x, cls: cls(x))
 
 
+class PatternSet:
+    """A set of patterns compiled into an automaton and searched in a single pass."""
+
+    def __init__(self, patterns: Iterable[Pattern | str]):
+        self.patterns = [p if isinstance(p, Pattern) else Pattern(p) for p in patterns]
+
+    @classmethod
+    def from_file(cls, file: TextIO) -> "PatternSet":
+        """Reads one pattern per line, ignoring empty lines and lines starting with #."""
+        lines = (line.strip() for line in file)
+        return cls(line for line in lines if line and not line.startswith("#"))
+
+    def __len__(self) -> int:
+        return len(self.patterns)
+
+    def __iter__(self) -> Iterator[Pattern]:
+        return iter(self.patterns)
+
+    def __getstate__(self):
+        # compiled automata cannot be pickled, they are rebuilt by each process
+        return {"patterns": self.patterns}
+
+    def _compile(self, step: int) -> pattern_fast.Automaton:
+        return pattern_fast.Automaton(
+            [(p.bits, p.mask, len(p.string)) for p in self.patterns], step
+        )
+
+    @functools.cached_property
+    def _byte_automaton(self) -> pattern_fast.Automaton:
+        return self._compile(2)
+
+    @functools.cached_property
+    def _nibble_automaton(self) -> pattern_fast.Automaton:
+        return self._compile(1)
+
+    def _automaton(
+        self, mode: Union[Literal["byte"], Literal["nibble"]]
+    ) -> pattern_fast.Automaton:
+        match mode:
+            case "byte":
+                return self._byte_automaton
+            case "nibble":
+                return self._nibble_automaton
+
+    def search(
+        self, data: bytes, mode: Union[Literal["byte"], Literal["nibble"]] = "byte"
+    ) -> list[array]:
+        return self._automaton(mode).search(data)
+
+    def count(
+        self, data: bytes, mode: Union[Literal["byte"], Literal["nibble"]] = "byte"
+    ) -> list[int]:
+        return self._automaton(mode).search(data, True)
+
+    def search_stream(
+        self,
+        file: BinaryIO,
+        mode: Union[Literal["byte"], Literal["nibble"]] = "byte",
+        chunk_size: int = STREAM_CHUNK_SIZE,
+    ) -> Iterator[list[array]]:
+        match mode:
+            case "byte":
+                unit, spans = 1, [p.bytelen for p in self.patterns]
+            case "nibble":
+                unit, spans = 2, [len(p.string) for p in self.patterns]
+        return search_stream(
+            lambda data: self.search(data, mode), file, spans, unit, chunk_size
+        )
+
+
 def bytes_and(a: bytes, b: bytes) -> Iterator[int]:
     return (a & b for a, b in zip(a, b))
 
 
-def find_pattern(bufs: list[Nibbles]) -> Pattern:
-    pattern = ""
-    for nibbles in zip(*bufs):
-        if len(set(nibbles)) == 1:
-            pattern += hex(nibbles[0])[2:]
-        else:
-            pattern += "?"
+_PATTERN_DIGITS = np.frombuffer(b"0123456789abcdef?", dtype=np.uint8)
+
+
+def find_pattern(bufs: Iterable[bytes | Nibbles]) -> Pattern:
+    """Finds the pattern of the nibbles shared by all buffers up to the length of the
+    shortest one. Buffers are folded into a running mask one at a time, so they can be
+    read lazily and memory does not grow with their number. Once every nibble is a
+    wildcard no more buffers are read, and the pattern is as long as the shortest
+    buffer read until then."""
+    first, equal = None, None
+    for buf in bufs:
+        nibbles = (buf if isinstance(buf, Nibbles) else Nibbles(buf)).array
+        if first is None:
+            first, equal = nibbles, np.ones(len(nibbles), dtype=bool)
+            continue
+        if len(nibbles) < len(first):
+            first, equal = first[: len(nibbles)], equal[: len(nibbles)]
+        equal &= first == nibbles[: len(first)]
+        if not equal.any():
+            # nothing is left to narrow, so the remaining buffers are not read
+            break
 
-    return Pattern(pattern)
+    if first is None:
+        return Pattern("")
+    chars = _PATTERN_DIGITS[np.where(equal, first, 16)]
+    return Pattern(chars.tobytes().decode("ascii"))
 
 
 @dataclass
@@ -131,6 +270,84 @@ class PatternClusters:
     unclustered: PatternCluster | None
 
 
+LSH_SEED = 0
+MIN_CLUSTER_SIZE = 5
+LSH_BATCH_SIZE = 4096
+
+
+def lsh_components(matrix: np.ndarray, bands: int, band_size: int) -> np.ndarray:
+    """Labels the connected components of rows which agree on every nibble of at least
+    one of bands random samples of band_size columns. This bit sampling is a locality
+    sensitive hash for the Hamming distance, so similar rows end up together."""
+    # scipy and sklearn are slow to import, so only clustering imports them
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    num_rows, num_cols = matrix.shape
+    rng = np.random.default_rng(LSH_SEED)
+    rows, cols = [np.arange(num_rows)], [np.arange(num_rows)]
+    for _ in range(bands):
+        columns = rng.choice(num_cols, min(band_size, num_cols), replace=False)
+        keys = np.ascontiguousarray(matrix[:, columns])
+        keys = keys.view(np.dtype((np.void, len(columns)))).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        rows.append(np.arange(num_rows))
+        cols.append(first[inverse.ravel()])
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    graph = coo_matrix(
+        (np.ones(len(rows), dtype=np.uint8), (rows, cols)), shape=(num_rows, num_rows)
+    )
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def cluster_matrix(
+    matrix: np.ndarray, jobs: int = 1, lsh_bands: int = 0, lsh_band_size: int = 8
+) -> np.ndarray:
+    """Clusters the rows of a nibble matrix by Hamming distance. With lsh_bands, rows
+    are grouped by lsh_components and only compared within batches of whole components
+    of about LSH_BATCH_SIZE rows, so the work grows linearly with the number of rows."""
+    if lsh_bands <= 0:
+        return _cluster_batch(matrix, jobs, False)
+
+    components = lsh_components(matrix, lsh_bands, lsh_band_size)
+    order = np.argsort(components, kind="stable")
+    groups = np.split(order, np.flatnonzero(np.diff(components[order])) + 1)
+
+    labels = np.full(len(matrix), -1)
+    next_label = 0
+    batch: list[np.ndarray] = []
+    for i, group in enumerate(groups):
+        if len(group) >= MIN_CLUSTER_SIZE:
+            batch.append(group)
+        batch_size = sum(len(members) for members in batch)
+        if batch and (batch_size >= LSH_BATCH_SIZE or i == len(groups) - 1):
+            members = np.concatenate(batch)
+            # HDBSCAN only finds a single cluster when asked to
+            batch_labels = _cluster_batch(matrix[members], jobs, len(batch) == 1)
+            labels[members] = np.where(batch_labels >= 0, batch_labels + next_label, -1)
+            next_label += batch_labels.max() + 1
+            batch = []
+    return labels
+
+
+def _cluster_batch(
+    matrix: np.ndarray, jobs: int, allow_single_cluster: bool
+) -> np.ndarray:
+    from sklearn.cluster import HDBSCAN
+
+    hdb = HDBSCAN(
+        min_cluster_size=MIN_CLUSTER_SIZE,
+        metric="hamming",
+        # joblib uses every available core for -1, as --jobs 0 does elsewhere
+        n_jobs=jobs if jobs > 0 else -1,
+        copy=True,
+        allow_single_cluster=allow_single_cluster,
+    )
+    return hdb.fit(matrix).labels_
+
+
 @app.command(
     help="Groups files based on similarity and finds patterns for these groups."
 )
@@ -139,22 +356,45 @@ def find_patterns_grouped(
     inputs: list[typer.FileBinaryRead],
     start_offset: int = 0,
     output: typer.FileTextWrite | None = sys.stdout,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="The number of processes computing distances. 0 uses every available \
+core.",
+        ),
+    ] = 1,
+    lsh_bands: Annotated[
+        int,
+        typer.Option(
+            "--lsh-bands",
+            help="Only compare files which share at least one of this many randomly \
+sampled sets of nibbles, which scales to large numbers of files. 0 compares every pair.",
+        ),
+    ] = 0,
+    lsh_band_size: Annotated[
+        int,
+        typer.Option(
+            "--lsh-band-size",
+            help="The number of nibbles in every set sampled by --lsh-bands.",
+        ),
+    ] = 8,
 ):
     nibs = []
     for input in inputs:
         input.seek(start_offset)
         nibs.append(Nibbles(input.read(length)))
 
-    hdb = HDBSCAN()
-    hdb.fit(nibs)
-    labels = hdb.labels_
+    labels = cluster_matrix(Nibbles.stack(nibs), jobs, lsh_bands, lsh_band_size)
+    members: dict[int, list[int]] = {}
+    for i, label in enumerate(labels.tolist()):
+        members.setdefault(label, []).append(i)
+
     clusters = dict()
-    for cluster in set(labels):
-        data = [
-            (inputs[i], nibs[i]) for i, label in enumerate(labels) if label == cluster
-        ]
-        pattern = find_pattern([buf for _, buf in data])
-        pattern_cluster = PatternCluster([input.name for input, _ in data], pattern)
+    for cluster, indices in members.items():
+        pattern = find_pattern(nibs[i] for i in indices)
+        pattern_cluster = PatternCluster([inputs[i].name for i in indices], pattern)
         clusters[cluster] = pattern_cluster
 
     unclustered = clusters.get(-1)
@@ -168,7 +408,7 @@ def find_patterns_grouped(
     )
 
     if output:
-        yaml.safe_dump(cattr.unstructure(pattern_clusters), output)
+        write_value(output, cattr.unstructure(pattern_clusters))
     return pattern_clusters
 
 
@@ -203,32 +443,110 @@ def find_patterns(
                     typer.FileBinaryRead(open(file, "rb"))
                     for file in sys.stdin.read().split()
                 )
-            case InputFormat.YAML:
+            case InputFormat.YAML | InputFormat.BINARY:
                 datas.extend(
-                    [
-                        dto.data[start_offset:]
-                        for dto in cattr.structure(
-                            yaml.safe_load(sys.stdin), list[_Input]
-                        )
-                    ]
+                    converter.structure(item, _Input).data[start_offset:]
+                    for item in read_records(sys.stdin)
                 )
 
-    for input in inputs:
-        input.seek(start_offset, io.SEEK_SET)
-        datas.append(input.read(length))
-
-    bufs = [Nibbles(data[:length] if length != -1 else data) for data in datas]
+    def read_inputs() -> Iterator[bytes]:
+        for data in datas:
+            yield data[:length] if length != -1 else data
+        for input in inputs:
+            input.seek(start_offset, io.SEEK_SET)
+            yield input.read(length)
 
-    find_pattern(bufs).print(output, output_width)
+    find_pattern(read_inputs()).print(output, output_width)
 
 
 class PatternTests(unittest.TestCase):
+    def test_find_pattern(self):
+        bufs = [b"\x12\x34\x56\x78", Nibbles(b"\x12\x44\x57"), b"\x12\x3f\x56\x00"]
+        self.assertEqual("12??5?", find_pattern(bufs).string)
+        self.assertEqual(
+            "????", find_pattern([b"\x00\x00", b"\xff\xff", b"\x00\x00"]).string
+        )
+        self.assertEqual("", find_pattern([]).string)
+
+    def test_find_pattern_stops_early(self):
+        def bufs():
+            yield b"\x00\x00"
+            yield b"\xff\xff"
+            raise AssertionError("read after every nibble became a wildcard")
+
+        self.assertEqual("????", find_pattern(bufs()).string)
+
     def test_search_ok(self):
         p = Pattern("01 01 ?? 01")
         results = p.search(b"\x01\x01\xfe\x01\x01\x01\x01")
-        self.assertEqual([0, 3], results)
+        self.assertEqual([0, 3], results.tolist())
 
     def test_search_empty(self):
         p = Pattern("01 01 ?? 01")
         results = p.search(b"\x01\x20\x01\x01")
-        self.assertEqual([], results)
+        self.assertEqual([], results.tolist())
+
+    def test_count(self):
+        p = Pattern("01 01 ?? 01")
+        self.assertEqual(2, p.count(b"\x01\x01\xfe\x01\x01\x01\x01"))
+        self.assertEqual(2, p.count(b"\x01\x01\xfe\x01\x01\x01\x01", "nibble"))
+
+    def test_search_stream(self):
+        p = Pattern("01 1? ?1")
+        data = b"\x01\x10\x11\x11\x01\x11\x01\x11\x11"
+        for mode in ("byte", "nibble"):
+            for chunk_size in (1, 2, 3, 5, 100):
+                results = p.search_stream(io.BytesIO(data), mode, chunk_size)
+                self.assertEqual(p.search(data, mode).tolist(), list(results))
+
+    def test_segments(self):
+        p = Pattern("01 02 ?? 03 04 05 1? 06 0")
+        self.assertEqual([b"\x01\x02", b"\x03\x04\x05", b"\x06"], p.segments)
+
+
+class PatternSetTests(unittest.TestCase):
+    def test_uninitialized(self):
+        automaton = pattern_fast.Automaton.__new__(pattern_fast.Automaton)
+        with self.assertRaises(RuntimeError):
+            automaton.search(b"abcdef")
+        with self.assertRaises(ValueError):
+            automaton.__init__([(b"\x01", b"\xff\xff", 2)], 2)
+        with self.assertRaises(RuntimeError):
+            automaton.search(b"abcdef")
+        automaton.__init__([(b"\x63", b"\xff", 2)], 2)
+        self.assertEqual([[2]], [list(p) for p in automaton.search(b"abcdef")])
+
+    def test_search_matches_single_patterns(self):
+        data = b"\x01\x01\xfe\x01\x01\x01\x01\xde\xad\xbe\xef\x10"
+        patterns = ["01 01 ?? 01", "de ad", "?e ?d", "0?", "ef 1", "1? ?1", "?? ??"]
+        pattern_set = PatternSet(patterns)
+        for mode in ("byte", "nibble"):
+            results = pattern_set.search(data, mode)
+            for pattern, positions in zip(pattern_set, results):
+                self.assertEqual(pattern.search(data, mode), positions)
+
+    def test_from_file(self):
+        pattern_set = PatternSet.from_file(io.StringIO("# header\n\nde ad\n?? 01\n"))
+        self.assertEqual(["dead", "??01"], [str(p) for p in pattern_set])
+
+
+class ClusterMatrixTests(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        bases = rng.integers(0, 16, (3, 64), dtype=np.uint8)
+        self.matrix = np.repeat(bases, 10, axis=0)
+        self.matrix[np.arange(30), np.arange(30) * 2] ^= 1
+
+    def test_lsh_components(self):
+        components = lsh_components(self.matrix, 8, 8)
+        self.assertEqual(3, len(set(components)))
+        for i in range(3):
+            self.assertEqual(1, len(set(components[i * 10 : (i + 1) * 10])))
+
+    def test_lsh_matches_exact(self):
+        exact = cluster_matrix(self.matrix)
+        approximate = cluster_matrix(self.matrix, lsh_bands=8)
+        self.assertEqual(3, len(set(exact)))
+        # the same partition, possibly numbered differently
+        self.assertEqual(3, len(set(zip(exact, approximate))))
+        self.assertEqual(3, len(set(approximate)))
@@ -1,14 +1,35 @@
-from typing import Optional
+from array import array
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Iterable, Iterator, Optional, Sequence
+import functools
 import attr
+import reven.fast.pattern as pattern_fast
 from typing_extensions import Annotated
 import typer
+import os
 import sys
-from reven.ops.pattern import Pattern
+from reven import lib
+from reven.index import NgramIndex
+from reven.ops.pattern import Pattern, PatternSet
 from enum import Enum
-from rich.progress import track
-from rich.console import Console
-from reven.lib import Tabular, TabularColumn, InputFormat, is_tty
-import yaml
+from reven.lib import (
+    Tabular,
+    TabularColumn,
+    InputFormat,
+    input_name,
+    is_tty,
+    map_input,
+    open_input,
+    process_inputs,
+    read_records,
+    count_stream,
+    count_threaded,
+    increment,
+    search_stream,
+    search_threaded,
+    STREAM_CHUNK_SIZE,
+    summarize_values,
+)
 
 
 app = typer.Typer()
@@ -20,6 +41,10 @@ class StringFormat(str, Enum):
     PATTERN = "pattern"
 
 
+def _format_positions(_, positions: array) -> str:
+    return summarize_values(positions, "{:x}".format)
+
+
 @attr.s(auto_attribs=True, frozen=True)
 class SearchDTO(Tabular):
     file_name: Annotated[
@@ -31,37 +56,113 @@ class SearchDTO(Tabular):
     count: int
     matches: Annotated[bool, TabularColumn(hidden=True)]
     positions: Annotated[
-        list[int],
+        array,
+        TabularColumn(name="Addresses (Hex)", format=_format_positions),
+    ]
+
+
+@attr.s(auto_attribs=True, frozen=True)
+class PatternMatchDTO(Tabular):
+    file_name: Annotated[
+        str,
         TabularColumn(
-            name="Addresses (Hex)", format=lambda _, x: " ".join(hex(y)[2:] for y in x)
+            highlight=lambda self, _: "bold green" if self.matches else "bold red"
         ),
     ]
+    pattern: str
+    count: int
+    matches: Annotated[bool, TabularColumn(hidden=True)]
+    positions: Annotated[
+        array,
+        TabularColumn(name="Addresses (Hex)", format=_format_positions),
+    ]
+
+
+def search_bytes(searchbytes: bytes, data: bytes) -> array:
+    return pattern_fast.bytes_search(searchbytes, data)
+
+
+def count_bytes(searchbytes: bytes, data: bytes) -> int:
+    return pattern_fast.bytes_search(searchbytes, data, True)
+
+
+def search_pattern(pattern: Pattern, data: bytes) -> array:
+    return pattern.search(data)
+
 
+def count_pattern(pattern: Pattern, data: bytes) -> int:
+    return pattern.count(data)
 
-def search_bytes(searchbytes: bytes, data: bytes) -> list[int]:
-    index = -1
-    indices = []
-    while True:
-        index = data.find(searchbytes, index + 1)
-        if index == -1:
-            break
-        indices.append(index)
-    return indices
 
+def _search_one(
+    search_fn: Callable[[Any, bytes], array], search_arg: Any, data: bytes
+) -> list[array]:
+    return [search_fn(search_arg, data)]
 
-def search_pattern(pattern: Pattern, data: bytes) -> list[int]:
-    return list(pattern.search(data))
+
+def _count_one(
+    count_fn: Callable[[Any, bytes], int], search_arg: Any, data: bytes
+) -> list[int]:
+    return [count_fn(search_arg, data)]
+
+
+def _search_input(
+    search: Callable[[bytes], list[array]],
+    spans: list[int],
+    threads: int,
+    chunk_size: Optional[int],
+    input: BinaryIO | str,
+) -> list[array]:
+    def search_buffer(data: bytes) -> list[array]:
+        return search_threaded(search, data, max(spans, default=0), threads)
+
+    if chunk_size is None:
+        with map_input(input) as data:
+            return search_buffer(data)
+
+    results = [array("Q") for _ in spans]
+    with open_input(input) as file:
+        for chunk_results in search_stream(
+            search_buffer, file, spans, chunk_size=chunk_size
+        ):
+            for positions, found in zip(results, chunk_results):
+                positions.extend(found)
+    return results
+
+
+def _count_input(
+    count: Callable[[bytes], list[int]],
+    overlap: int,
+    threads: int,
+    chunk_size: Optional[int],
+    input: BinaryIO | str,
+) -> list[int]:
+    def count_buffer(data: bytes) -> list[int]:
+        return count_threaded(count, data, overlap, threads)
+
+    if chunk_size is None:
+        with map_input(input) as data:
+            return count_buffer(data)
+
+    with open_input(input) as file:
+        return count_stream(count_buffer, file, overlap, chunk_size)
 
 
 @app.command(help="Searches for data within inputs.")
 def search(
     data_format: Annotated[
-        StringFormat,
+        Optional[StringFormat],
         typer.Option(
-            help="The format of the data used in search.",
+            help="The format of the data used in search. Required unless --pattern-file is used.",
+        ),
+    ] = None,
+    data: Annotated[
+        Optional[str],
+        typer.Argument(
+            help="The data to search for. Treated as the first input file when \
+--pattern-file is used."
         ),
-    ],
-    data: Annotated[str, typer.Argument(help="The data to search for.")],
+    ] = None,
     inputs: Annotated[
         list[typer.FileBinaryRead],
         typer.Argument(help="The files to search within."),
@@ -83,45 +184,251 @@ def search(
             help="Minimum number of occurrences to mark the file as matched.",
         ),
     ] = 1,
-) -> list[SearchDTO]:
-    match data_format:
-        case StringFormat.TEXT:
-            search_arg = data.encode("utf-8")
-            search_fn = search_bytes
-        case StringFormat.HEX:
-            search_arg = bytearray.fromhex(data)
-            search_fn = search_bytes
-        case StringFormat.PATTERN:
-            search_arg = Pattern(data)
-            search_fn = search_pattern
-
-    inputs: set[typer.FileBinaryRead] = set(inputs) if inputs else set()
+    pattern_file: Annotated[
+        Optional[typer.FileText],
+        typer.Option(
+            "--pattern-file",
+            "-p",
+            help="A file with one pattern per line. All patterns are searched for in a single pass over each input.",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs",
+            "-j",
+            help="The number of files to search in parallel. 0 uses every available core.",
+        ),
+    ] = 1,
+    threads: Annotated[
+        int,
+        typer.Option(
+            "--threads",
+            "-t",
+            help="The number of threads used to search each large file in chunks.",
+        ),
+    ] = 1,
+    stream: Annotated[
+        bool,
+        typer.Option(
+            "--stream",
+            help="Read inputs in chunks instead of mapping them, e.g. for inputs larger than memory.",
+        ),
+    ] = False,
+    chunk_size: Annotated[
+        int,
+        typer.Option("--chunk-size", help="The size in bytes of chunks read by --stream."),
+    ] = STREAM_CHUNK_SIZE,
+    count_only: Annotated[
+        bool,
+        typer.Option(
+            "--count-only", help="Only count the matches without reporting positions."
+        ),
+    ] = False,
+    index: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--index",
+            "-x",
+            help="An index built by `index build`. Only the files which may match are \
+searched, which are all indexed files unless inputs are given.",
+        ),
+    ] = None,
+) -> list[SearchDTO] | list[PatternMatchDTO]:
+    if index is not None and lib.input_decoding is not None:
+        raise typer.BadParameter(
+            "cannot be combined with --decode, since indexes hold the trigrams of the \
+undecoded files.",
+            param_hint="--index",
+        )
+    if pattern_file is not None:
+        if data is not None:
+            # typer binds the first input file to data
+            if not Path(data).is_file():
+                raise typer.BadParameter(
+                    f"{data} is not a file. Only files to search are given with \
+--pattern-file.",
+                    param_hint="inputs",
+                )
+            inputs = [data, *(inputs or [])]
+        pattern_set = PatternSet.from_file(pattern_file)
+    elif data_format is None or data is None:
+        raise typer.BadParameter(
+            "--data-format and data are required unless --pattern-file is used."
+        )
+    else:
+        match data_format:
+            case StringFormat.TEXT:
+                search_arg = data.encode("utf-8")
+                search_fn, count_fn = search_bytes, count_bytes
+                span = len(search_arg)
+            case StringFormat.HEX:
+                search_arg = bytearray.fromhex(data)
+                search_fn, count_fn = search_bytes, count_bytes
+                span = len(search_arg)
+            case StringFormat.PATTERN:
+                search_arg = Pattern(data)
+                search_fn, count_fn = search_pattern, count_pattern
+                span = search_arg.bytelen
+
+    # inputs named on stdin or by the index are opened by the workers, so that
+    # thousands of files are not open at once
+    inputs: set[typer.FileBinaryRead | str] = set(inputs) if inputs else set()
 
     if not is_tty(sys.stdin):
         match input_format:
             case InputFormat.FILE_LIST:
                 files = sys.stdin.read().split()
-            case InputFormat.YAML:
-                files = (item["file_name"] for item in yaml.safe_load(sys.stdin))
-
-        inputs.update(typer.FileBinaryRead(open(file, "rb")) for file in files)
-
-    dtos: list[SearchDTO] = []
-    for input in track(inputs, console=Console(file=sys.stderr), description=""):
-        data = input.read()
-        indices = search_fn(search_arg, data)
-        dtos.append(
-            SearchDTO(
-                file_name=input.name,
-                matches=len(indices) >= min_count,
-                count=len(indices),
-                positions=indices,
-            )
+            case InputFormat.YAML | InputFormat.BINARY:
+                files = (item["file_name"] for item in read_records(sys.stdin))
+
+        inputs.update(files)
+
+    if index is not None:
+        if pattern_file is not None:
+            queries = [pattern.segments for pattern in pattern_set]
+        elif data_format == StringFormat.PATTERN:
+            queries = [search_arg.segments]
+        else:
+            queries = [[bytes(search_arg)]]
+        inputs = _index_candidates(NgramIndex(index), queries, inputs)
+
+    inputs = sorted(inputs, key=input_name)
+    chunk_size = chunk_size if stream else None
+
+    if pattern_file is not None:
+        return search_pattern_set(
+            pattern_set, inputs, output, min_count, jobs, threads, chunk_size, count_only
         )
 
-    dtos = sorted(dtos, key=lambda x: x.file_name)
+    if count_only:
+        worker = functools.partial(
+            _count_input,
+            functools.partial(_count_one, count_fn, search_arg),
+            span,
+            threads,
+            chunk_size,
+        )
+    else:
+        worker = functools.partial(
+            _search_input,
+            functools.partial(_search_one, search_fn, search_arg),
+            [span],
+            threads,
+            chunk_size,
+        )
+    results = process_inputs(
+        worker,
+        inputs,
+        jobs=jobs,
+        progress=True,
+        cache_key=f"search:{count_only}:{data_format.value}:{data}",
+    )
+
+    dtos = _search_dtos(inputs, results, min_count, count_only)
+    return _write_collected(SearchDTO, output, dtos)
+
+
+def _write_collected[T: Tabular](
+    cls: type[T], output: Optional[typer.FileTextWrite], dtos: Iterator[T]
+) -> list[T]:
+    """Writes the results while they are produced, and returns all of them, including
+    those left out of a truncated table."""
+    collected = []
+
+    def collect() -> Iterator[T]:
+        for dto in dtos:
+            collected.append(dto)
+            yield dto
 
     if output:
-        SearchDTO.tabular_write(output, dtos)
+        cls.tabular_write(output, collect())
+    collected.extend(dtos)
+    return collected
+
+
+def _search_dtos(
+    inputs: Sequence[typer.FileBinaryRead | str],
+    results: Iterable[tuple[array | int]],
+    min_count: int,
+    count_only: bool,
+) -> Iterator[SearchDTO]:
+    for (result,), input in zip(results, inputs):
+        count, indices = (result, array("Q")) if count_only else (len(result), result)
+        increment("matches", count)
+        yield SearchDTO(
+            file_name=input_name(input),
+            matches=count >= min_count,
+            count=count,
+            positions=indices,
+        )
+
 
-    return dtos
+def _index_candidates(
+    index: NgramIndex,
+    queries: list[list[bytes]],
+    inputs: set[typer.FileBinaryRead | str],
+) -> set[typer.FileBinaryRead | str]:
+    candidates = index.candidates(queries)
+    if not inputs:
+        return set(candidates)
+    # inputs which are not indexed are always searched
+    candidates = set(candidates)
+    return {
+        input
+        for input in inputs
+        if input_name(input) not in index
+        or os.path.realpath(input_name(input)) in candidates
+    }
+
+
+def search_pattern_set(
+    pattern_set: PatternSet,
+    inputs: Sequence[typer.FileBinaryRead | str],
+    output: Optional[typer.FileTextWrite],
+    min_count: int,
+    jobs: int = 1,
+    threads: int = 1,
+    chunk_size: Optional[int] = None,
+    count_only: bool = False,
+) -> list[PatternMatchDTO]:
+    spans = [pattern.bytelen for pattern in pattern_set]
+    if count_only:
+        worker = functools.partial(
+            _count_input, pattern_set.count, max(spans, default=0), threads, chunk_size
+        )
+    else:
+        worker = functools.partial(
+            _search_input, pattern_set.search, spans, threads, chunk_size
+        )
+    cache_key = f"search-set:{count_only}:" + "\n".join(
+        pattern.string for pattern in pattern_set
+    )
+    all_results = process_inputs(
+        worker, inputs, jobs=jobs, progress=True, cache_key=cache_key
+    )
+
+    dtos = _pattern_match_dtos(pattern_set, inputs, all_results, min_count, count_only)
+    return _write_collected(PatternMatchDTO, output, dtos)
+
+
+def _pattern_match_dtos(
+    pattern_set: PatternSet,
+    inputs: Sequence[typer.FileBinaryRead | str],
+    all_results: Iterable[list[array | int]],
+    min_count: int,
+    count_only: bool,
+) -> Iterator[PatternMatchDTO]:
+    for results, input in zip(all_results, inputs):
+        for pattern, result in zip(pattern_set, results):
+            count, indices = (
+                (result, array("Q")) if count_only else (len(result), result)
+            )
+            increment("matches", count)
+            yield PatternMatchDTO(
+                file_name=input_name(input),
+                pattern=str(pattern),
+                matches=count >= min_count,
+                count=count,
+                positions=indices,
+            )
@@ -1,12 +1,20 @@
+from collections import defaultdict
 from dataclasses import dataclass
-import io
 import sys
-import yaml
+from typing import BinaryIO, Iterable, Iterator, Optional
 import cattr
 import typer
+import unittest
 
 from typing_extensions import Annotated
-from reven.lib import InputFormat, is_tty
+from reven.lib import (
+    InputFormat,
+    converter,
+    is_tty,
+    map_input,
+    read_records,
+    write_records,
+)
 
 app = typer.Typer()
 
@@ -14,6 +22,7 @@ app = typer.Typer()
 @dataclass
 class SliceResult:
     file_name: str
+    position: int
     length: int
     data: bytes
 
@@ -27,7 +36,9 @@ class NumWithSign:
 @dataclass
 class _Input:
     file_name: str
-    position: int
+    position: int = 0
+    # the positions of matches written by search, which replace position
+    positions: Optional[list[int]] = None
 
 
 def parse_num(s: str):
@@ -77,51 +88,102 @@ def slice(
         ),
     ] = InputFormat.FILE_LIST,
     output: Annotated[typer.FileTextWrite, typer.Option("--output", "-o")] = sys.stdout,
+    coalesce: Annotated[
+        bool,
+        typer.Option(
+            help="Write overlapping ranges of a file as a single slice, instead of one \
+slice per position.",
+        ),
+    ] = True,
 ):
-    dtos: list[SliceResult] = []
-
-    inputs: dict[str, tuple[typer.FileBinaryRead, int]] = (
-        {input.name: (input, 0) for input in inputs} if inputs else dict()
-    )
+    files: dict[str, BinaryIO | str] = {}
+    positions: dict[str, set[int]] = defaultdict(set)
+    for input in inputs or []:
+        files[input.name] = input
+        positions[input.name].add(0)
 
     if not is_tty(sys.stdin):
         match input_format:
             case InputFormat.FILE_LIST:
-                piped_inputs = set(
-                    (file_name, 0) for file_name in sys.stdin.read().split()
-                )
+                for file_name in sys.stdin.read().split():
+                    files.setdefault(file_name, file_name)
+                    positions[file_name].add(0)
+
+            case InputFormat.YAML | InputFormat.BINARY:
+                for item in read_records(sys.stdin):
+                    dto = converter.structure(item, _Input)
+                    if dto.positions is None:
+                        dto.positions = [dto.position]
+                    elif not dto.positions:
+                        # files without matches have nothing to slice
+                        continue
+                    files.setdefault(dto.file_name, dto.file_name)
+                    positions[dto.file_name].update(dto.positions)
+
+    write_records(
+        output,
+        map(cattr.unstructure, _slice_inputs(files, positions, start, end, coalesce)),
+    )
 
-            case InputFormat.YAML:
-                in_dtos = cattr.structure(yaml.safe_load(sys.stdin), list[_Input])
-                piped_inputs = set((dto.file_name, dto.position) for dto in in_dtos)
-
-        inputs.update(
-            {
-                file: (typer.FileBinaryRead(open(file, "rb")), pos)
-                for (file, pos) in piped_inputs
-            }
-        )
-
-    for input, pos in inputs.values():
-        input.seek(0, io.SEEK_END)
-        input_len = input.tell()
-        input.seek(pos + start, io.SEEK_SET)
-
-        match end.sign:
-            case 1:
-                length = end.num
-            case 0:
-                length = max(end.num - input.tell(), 0)
-            case -1:
-                length = max(input_len - input.tell() - end.num, 0)
-
-        dtos.append(
-            SliceResult(
-                file_name=input.name,
-                length=length,
-                data=input.read(length)[:length],
+
+def _range(size: int, position: int, start: int, end: NumWithSign) -> tuple[int, int]:
+    """Returns the beginning and length of the range of a position, cut to the file."""
+    begin = position + start
+    match end.sign:
+        case 1:
+            stop = begin + end.num
+        case 0:
+            stop = end.num
+        case -1:
+            stop = size - end.num
+    begin, stop = min(max(begin, 0), size), min(max(stop, 0), size)
+    return begin, max(stop - begin, 0)
+
+
+def _coalesce(ranges: Iterable[tuple[int, int]]) -> Iterator[tuple[int, int]]:
+    """Merges overlapping ranges, which must be sorted by their beginning."""
+    current = None
+    for begin, length in ranges:
+        if current is not None and begin < current[0] + current[1]:
+            current = (current[0], max(current[1], begin + length - current[0]))
+            continue
+        if current is not None:
+            yield current
+        current = (begin, length)
+    if current is not None:
+        yield current
+
+
+def _slice_inputs(
+    files: dict[str, BinaryIO | str],
+    positions: dict[str, set[int]],
+    start: int,
+    end: NumWithSign,
+    coalesce: bool,
+) -> Iterator[SliceResult]:
+    """Maps every file once and yields its ranges in order, as they are read."""
+    for file_name in sorted(files):
+        with map_input(files[file_name]) as data:
+            ranges = sorted(
+                {_range(len(data), pos, start, end) for pos in positions[file_name]}
             )
-        )
+            if coalesce:
+                ranges = _coalesce(ranges)
+            for begin, length in ranges:
+                yield SliceResult(
+                    file_name=file_name,
+                    position=begin,
+                    length=length,
+                    data=data[begin : begin + length],
+                )
+
 
-    dtos = sorted(dtos, key=lambda x: x.file_name)
-    yaml.safe_dump(cattr.unstructure(dtos), output)
+class SliceTests(unittest.TestCase):
+    def test_ranges(self):
+        ranges = sorted(_range(100, pos, -4, NumWithSign(1, 8)) for pos in [2, 8, 50])
+        # the window of 2 starts at -2 and is cut to the file
+        self.assertEqual(ranges, [(0, 6), (4, 8), (46, 8)])
+        self.assertEqual(list(_coalesce(ranges)), [(0, 12), (46, 8)])
+        self.assertEqual(_range(100, 2, -8, NumWithSign(1, 4)), (0, 0))
+        self.assertEqual(_range(100, 96, 0, NumWithSign(1, 8)), (96, 4))
+        self.assertEqual(_range(100, 0, 10, NumWithSign(-1, 20)), (10, 70))
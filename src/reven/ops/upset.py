@@ -1,4 +1,5 @@
 from typing import Optional
+import unittest
 import warnings
 import attr
 import sys
@@ -10,8 +11,11 @@ import matplotlib
 import matplotlib.pyplot as plt
 import numpy as np
 from pandas import DataFrame, MultiIndex
-from reven.ops.search import search, StringFormat
-from reven.lib import Tabular, TabularColumn
+from rich.progress import track
+from rich.console import Console
+from reven.ops.pattern import Pattern, PatternSet
+from reven.ops.search import StringFormat
+from reven.lib import Tabular, TabularColumn, summarize_values
 
 
 app = typer.Typer()
@@ -20,7 +24,33 @@ app = typer.Typer()
 @attr.s(auto_attribs=True, frozen=True)
 class UpsetDTO(Tabular):
     sets: Annotated[list[str], TabularColumn(format=lambda _, x: " ".join(x))]
-    file_names: Annotated[list[str], TabularColumn(format=lambda _, x: "\n".join(x))]
+    file_names: Annotated[
+        list[str], TabularColumn(format=lambda _, x: summarize_values(x, str, "\n"))
+    ]
+
+
+def search_ranges(pattern_set: PatternSet, data: bytes) -> dict[str, list[int]]:
+    """Finds the positions of every contiguous range of patterns i..j, where pattern i
+    is directly followed by pattern i + 1 and so on until pattern j."""
+    if all(len(p.string) % 2 == 0 for p in pattern_set):
+        mode, lengths = "byte", [p.bytelen for p in pattern_set]
+    else:
+        mode, lengths = "nibble", [len(p.string) for p in pattern_set]
+
+    positions = pattern_set.search(data, mode)
+    position_sets = [set(x) for x in positions]
+
+    ranges = {}
+    for i in range(len(pattern_set)):
+        found, offset = positions[i].tolist(), lengths[i]
+        for j in range(i, len(pattern_set)):
+            if j > i:
+                found = [p for p in found if p + offset in position_sets[j]]
+                offset += lengths[j]
+            ranges[f"{i + 1}-{j + 1}"] = (
+                found if mode == "byte" else [p // 2 for p in found if p % 2 == 0]
+            )
+    return ranges
 
 
 @app.command(
@@ -65,33 +95,32 @@ If you want to search only one string, use the 'search' operation instead ;)."
         raise typer.Abort()
 
     # -- Search for string combinations --
-    def get_input_files():
-        return [open(path, "rb") for path in data_and_paths[divider_i + 1 :]]
-
-    search_results = {
-        f"{i + 1}-{j + 1}": list(
-            filter(
-                lambda s: s.matches,
-                search(
-                    data_format=data_format,
-                    data="".join(search_strings[i : j + 1]),
-                    inputs=get_input_files(),
-                    output=None,
-                    min_count=min_count,
-                ),
-            ),
-        )
+    match data_format:
+        case StringFormat.TEXT:
+            patterns = [Pattern(s.encode("utf-8").hex()) for s in search_strings]
+        case StringFormat.HEX:
+            patterns = [Pattern(bytes.fromhex(s).hex()) for s in search_strings]
+        case StringFormat.PATTERN:
+            patterns = [Pattern(s) for s in search_strings]
+    pattern_set = PatternSet(patterns)
+
+    inputs = [open(path, "rb") for path in data_and_paths[divider_i + 1 :]]
+    search_results: dict[str, set[str]] = {
+        f"{i + 1}-{j + 1}": set()
         for i in range(len(search_strings))
         for j in range(i, len(search_strings))
     }
+    for input in track(inputs, console=Console(file=sys.stderr), description=""):
+        for range_id, positions in search_ranges(pattern_set, input.read()).items():
+            if len(positions) >= min_count:
+                search_results[range_id].add(input.name)
 
     # -- Group the search result --
-    inputs = get_input_files()
     categories = sorted([range_id for range_id in search_results], reverse=True)
     file_names = [file.name for file in inputs]
 
     data: dict[str, list[bool]] = {
-        range_id: [fw in map(lambda s: s.file_name, range_res) for fw in file_names]
+        range_id: [fw in range_res for fw in file_names]
         for range_id, range_res in search_results.items()
     }
 
@@ -157,3 +186,19 @@ Need matching(s) of at least 2 search strings."
         upset.plot()
 
     plt.show()
+
+
+class SearchRangesTests(unittest.TestCase):
+    def test_byte_ranges(self):
+        pattern_set = PatternSet(["aa", "bb", "cc"])
+        ranges = search_ranges(pattern_set, b"\xaa\xbb\xcc\xaa\xcc\xbb\xcc")
+        self.assertEqual([0, 3], ranges["1-1"])
+        self.assertEqual([0], ranges["1-2"])
+        self.assertEqual([0], ranges["1-3"])
+        self.assertEqual([1, 5], ranges["2-3"])
+
+    def test_nibble_ranges(self):
+        pattern_set = PatternSet(["a", "?b", "c"])
+        ranges = search_ranges(pattern_set, b"\xa1\xbc\x0a\x1b\xc0")
+        self.assertEqual([0], ranges["1-3"])
+        self.assertEqual([3], ranges["2-3"])